@@ -0,0 +1,53 @@
+"""Memory of the catalog as a list of dicts vs the columnar CatalogView, and
+the cost of a category + price filter over each.
+
+    python benchmarks/bench_catalog_memory.py [--products 100000]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "green_next_shopping_agent" / "sub_agents" / "mcp_server"))
+
+from bench_converters import PREFIX, make_catalog
+from catalog_snapshot import CatalogView
+from converters import product_to_dict
+
+
+def traced(build):
+    tracemalloc.start()
+    value = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+
+    for n in args.products:
+        catalog = make_catalog(n)
+        dicts, dict_bytes = traced(lambda: [product_to_dict(p, PREFIX) for p in catalog.products])
+        view, view_bytes = traced(lambda: CatalogView(catalog))
+        print(f"{n:>7} products: dicts {dict_bytes / n:6.0f} B/product, columnar {view_bytes / n:6.0f} B/product")
+
+        def dict_filter():
+            return [d for d in dicts if "kitchen" in d["categories"] and 10 <= d["price_usd"] + d["price_usd_nanos"] / 1e9 <= 20]
+
+        def view_filter():
+            return view.to_dicts(view.filter(["kitchen"], 10, 20), PREFIX)
+
+        assert len(dict_filter()) == len(view_filter())
+        for label, fn in (("dicts", dict_filter), ("columnar", view_filter)):
+            seconds = min(timeit.repeat(fn, number=3, repeat=3)) / 3
+            print(f"{'':>7} filter {label:<9} {seconds * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
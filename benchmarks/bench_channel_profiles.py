@@ -0,0 +1,109 @@
+"""Latency of catalog listing and small cart RPCs under each channel profile.
+
+Runs an in-process gRPC server (with and without response compression) and
+times ListProducts for a large catalog and AddItem for a tiny request.
+
+    python benchmarks/bench_channel_profiles.py [--products 10000] [--calls 200]
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import statistics
+import sys
+import time
+from concurrent import futures
+from pathlib import Path
+
+import grpc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "green_next_shopping_agent" / "sub_agents" / "mcp_server"))
+
+import demo_pb2, demo_pb2_grpc
+from bench_converters import make_catalog
+from channels import PROFILES, create_channel
+
+
+class Catalog(demo_pb2_grpc.ProductCatalogServiceServicer):
+    def __init__(self, response: demo_pb2.ListProductsResponse) -> None:
+        self.response = response
+
+    def ListProducts(self, request, context):
+        return self.response
+
+
+class Cart(demo_pb2_grpc.CartServiceServicer):
+    def AddItem(self, request, context):
+        return demo_pb2.Empty()
+
+
+def serve(catalog: demo_pb2.ListProductsResponse, compression) -> tuple:
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=8),
+        compression=compression,
+        options=[("grpc.max_send_message_length", 256 * 1024 * 1024)],
+    )
+    demo_pb2_grpc.add_ProductCatalogServiceServicer_to_server(Catalog(catalog), server)
+    demo_pb2_grpc.add_CartServiceServicer_to_server(Cart(), server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    return server, f"127.0.0.1:{port}"
+
+
+def timed(fn, calls: int) -> tuple:
+    fn()  # connect and warm up
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    catalog = make_catalog(args.products)
+    raw = catalog.SerializeToString()
+    print(f"ListProductsResponse: {len(raw) / 1024:.0f} KiB raw, {len(gzip.compress(raw)) / 1024:.0f} KiB gzip")
+
+    list_p50s = {}
+    for server_compression in (None, grpc.Compression.Gzip):
+        server, target = serve(catalog, server_compression)
+        label = "gzip" if server_compression else "none"
+        try:
+            for name in ("grpc-defaults", *PROFILES):
+                if name == "grpc-defaults":
+                    channel = grpc.insecure_channel(target, options=[("grpc.max_receive_message_length", 256 * 1024 * 1024)])
+                else:
+                    channel = create_channel(target, PROFILES[name])
+                catalog_stub = demo_pb2_grpc.ProductCatalogServiceStub(channel)
+                cart_stub = demo_pb2_grpc.CartServiceStub(channel)
+                item = demo_pb2.AddItemRequest(user_id="u", item=demo_pb2.CartItem(product_id="P000001", quantity=1))
+                list_p50, list_p95 = timed(lambda: catalog_stub.ListProducts(demo_pb2.Empty()), max(args.calls // 10, 10))
+                add_p50, add_p95 = timed(lambda: cart_stub.AddItem(item), args.calls)
+                list_p50s[label, name] = list_p50
+                print(
+                    f"server={label:4} profile={name:13} "
+                    f"ListProducts p50={list_p50:7.2f}ms p95={list_p95:7.2f}ms  "
+                    f"AddItem p50={add_p50:5.2f}ms p95={add_p95:5.2f}ms"
+                )
+                channel.close()
+        finally:
+            server.stop(None)
+
+    # Compression pays off once the wire time it saves exceeds its CPU cost
+    extra_ms = list_p50s["gzip", "catalog"] - list_p50s["none", "catalog"]
+    saved_bits = (len(raw) - len(gzip.compress(raw))) * 8
+    if extra_ms > 0:
+        print(f"gzip costs {extra_ms:.1f}ms per listing; worth it below ~{saved_bits / extra_ms / 1e6:.2f} Gbit/s")
+    else:
+        print("gzip is faster even on loopback")
+
+
+if __name__ == "__main__":
+    main()
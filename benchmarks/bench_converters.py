@@ -0,0 +1,76 @@
+"""Per-product cost of protobuf -> dict / JSON conversion at catalog scale.
+
+    python benchmarks/bench_converters.py [--products 10000 100000]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "green_next_shopping_agent" / "sub_agents" / "mcp_server"))
+
+import demo_pb2
+from converters import product_to_dict, products_to_json_bytes
+
+PREFIX = "http://35.185.109.77/"
+CATEGORIES = ["kitchen", "clothing", "accessories", "home", "footwear"]
+
+
+def make_catalog(n: int) -> demo_pb2.ListProductsResponse:
+    resp = demo_pb2.ListProductsResponse()
+    for i in range(n):
+        resp.products.add(
+            id=f"P{i:06d}",
+            name=f"Product {i}",
+            description=f"Reusable stainless steel item number {i}, made to last for years.",
+            picture=f"/static/img/products/p{i}.jpg",
+            price_usd=demo_pb2.Money(currency_code="USD", units=5 + i % 50, nanos=990000000),
+            categories=[CATEGORIES[i % 5], CATEGORIES[(i + 1) % 5]],
+        )
+    return resp
+
+
+def baseline(products):
+    # The per-field comprehension the MCP tools used before converters.py
+    return {
+        "results": [
+            {
+                "id": p.id,
+                "name": p.name,
+                "description": p.description,
+                "picture": (f"{PREFIX}{p.picture}" if PREFIX else p.picture),
+                "price_usd": p.price_usd.units,
+                "price_usd_nanos": p.price_usd.nanos,
+                "categories": list(p.categories),
+            }
+            for p in products
+        ]
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cases = {
+        "baseline dict": baseline,
+        "converters dict": lambda ps: {"results": [product_to_dict(p, PREFIX) for p in ps]},
+        "baseline dict + json.dumps": lambda ps: json.dumps(baseline(ps)).encode(),
+        "converters json bytes": lambda ps: products_to_json_bytes(ps, PREFIX),
+    }
+    for n in args.products:
+        products = make_catalog(n).products
+        assert json.loads(products_to_json_bytes(products, PREFIX)) == baseline(products)
+        print(f"\n{n} products")
+        for name, fn in cases.items():
+            best = min(timeit.repeat(lambda: fn(products), number=1, repeat=args.repeat))
+            print(f"  {name:<28} {best * 1e3:9.1f} ms  {best / n * 1e9:8.0f} ns/product")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,9 @@ from google.adk.agents import Agent
 from green_next_shopping_agent.sub_agents.sequencial_delegation_agent import sequencial_delegation_agent
 from green_next_shopping_agent.sub_agents.mcp_product_order_agent import mcp_product_order_agent
 from green_next_shopping_agent.constants import GEMINI_MODEL
+from green_next_shopping_agent.token_budget import budgeted_instruction, record_prompt_tokens, record_model_usage, enforce_tool_budget
+from green_next_shopping_agent.rate_limiter import INTERACTIVE, RateLimitedGemini
+from green_next_shopping_agent.intent_router import route_intent
 from google.adk.tools.tool_context import ToolContext
 from typing import Dict
 
@@ -16,9 +19,9 @@ def set_user_id(
 
 root_agent = Agent(
     name="green_next_shopping_agent",
-    model= GEMINI_MODEL,
+    model=RateLimitedGemini(model=GEMINI_MODEL, priority=INTERACTIVE, route="root"),
     description="A Manager agent that orchestrates the Image and text analysis and MCP output.",
-    instruction="""
+    instruction=budgeted_instruction("""
      ## Your Role as Manager
      You are a manager agent that orchestrates the Image and text analysis and MCP output.
      
@@ -34,8 +37,12 @@ root_agent = Agent(
      - If the user wants to place the order, you need to delegate the task to the mcp_product_order_agent.
 
      **MAndatory: Make sure first the Phase 1 is completed and then the Phase 2 is completed.
-    """,
+    """),
     sub_agents=[sequencial_delegation_agent,mcp_product_order_agent],
-    tools=[set_user_id]
+    tools=[set_user_id],
+    # The router answers clear-cut turns (email, browse, cart/order) without a model call
+    before_model_callback=[route_intent, record_prompt_tokens],
+    after_model_callback=record_model_usage,
+    after_tool_callback=enforce_tool_budget,
 
 )
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.tool_context import ToolContext
+from google.genai import types
+
+from green_next_shopping_agent.constants import ANSWER_CACHE_MAX, ANSWER_CACHE_TTL
+from green_next_shopping_agent.product_cards import PRODUCT_TOOLS, cards_text, products_in, tool_payload
+from green_next_shopping_agent.token_budget import ledger
+
+logger = logging.getLogger(__name__)
+
+# Outputs of the details agent and the analyzer that make up a full answer
+ANSWER_KEYS = ("mcp_product_details", "analysed_product_greeness")
+# Tools whose results depend only on the query and the catalog
+CACHEABLE_TOOLS = frozenset(PRODUCT_TOOLS) - {"search_by_image"} | {"get_ads"}
+
+EMAIL = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+WORD = re.compile(r"[a-z0-9$]+")
+FILLER = frozenset(
+    "a an the i me my you your we us please pls can could would will want wanna need like to for of some any "
+    "hi hello hey thanks thank just also now".split()
+)
+
+
+def normalize(text: str) -> Optional[str]:
+    """Content words of a query in their order, without emails or filler."""
+    words = [w for w in WORD.findall(EMAIL.sub(" ", text.lower())) if w not in FILLER]
+    return " ".join(words) or None
+
+
+class Answer(NamedTuple):
+    catalog_version: str
+    text: str
+    state: Dict[str, Any]
+    expires: float
+
+
+class AnswerCache:
+    """LRU of rendered answers by normalized query, valid for one catalog version."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Answer]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Newest catalog version seen in any tool result
+        self.catalog_version: Optional[str] = None
+
+    def get(self, key: str) -> Optional[Answer]:
+        with self._lock:
+            answer = self._entries.get(key)
+            if answer is None:
+                return None
+            if time.monotonic() > answer.expires or answer.catalog_version != self.catalog_version:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return answer
+
+    def put(self, key: str, catalog_version: str, text: str, state: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = Answer(catalog_version, text, state, time.monotonic() + self._ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def saw_catalog_version(self, version: str) -> None:
+        with self._lock:
+            if version != self.catalog_version:
+                if self.catalog_version is not None:
+                    logger.info(f"Catalog changed ({self.catalog_version} -> {version}), dropping {len(self._entries)} cached answers")
+                self._entries.clear()
+                self.catalog_version = version
+
+
+answers = AnswerCache(ANSWER_CACHE_MAX, ANSWER_CACHE_TTL)
+
+
+def _query_key(callback_context: CallbackContext) -> Optional[str]:
+    # Later queries may lean on earlier answers ("next page", "more like that"),
+    # so only a session's first product query is looked up or stored
+    if not callback_context.state.get("temp:first_product_query"):
+        return None
+    content = callback_context.user_content
+    if content is None or not content.parts or any(part.inline_data for part in content.parts):
+        return None
+    return normalize(" ".join(part.text for part in content.parts if part.text))
+
+
+def record_results(tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext, tool_response: Any) -> Optional[Dict]:
+    """after_tool_callback for the details agent: notes what the answer is built from.
+
+    Also keeps the ids of ranked results in session state, so "item 2" still
+    resolves after an answer served from the cache (see resolve_rank).
+    """
+    state = tool_context.state
+    if tool.name not in CACHEABLE_TOOLS or args.get("cursor"):
+        state["temp:answer_uncacheable"] = True
+        return None
+    if tool.name not in PRODUCT_TOOLS:
+        return None
+    payload = tool_payload(tool_response)
+    if payload.get("catalog_version"):
+        answers.saw_catalog_version(payload["catalog_version"])
+        state["temp:catalog_version"] = payload["catalog_version"]
+    products: List[Dict[str, Any]] = list(products_in(payload))
+    if products and "rank" in products[0]:
+        state["last_result_ids"] = [p["id"] for p in products]
+    if products:
+        state["temp:answer_cards"] = (state.get("temp:answer_cards", "") + "\n\n" + cards_text(products)).strip()
+    return None
+
+
+def cached_answer(callback_context: CallbackContext) -> Optional[types.Content]:
+    """before_agent_callback: serves a repeated query without running the agents."""
+    if not any(callback_context.state.get(name) for name in ANSWER_KEYS):
+        callback_context.state["temp:first_product_query"] = True
+    key = _query_key(callback_context)
+    answer = answers.get(key) if key else None
+    if answer is None:
+        return None
+    for name, value in answer.state.items():
+        callback_context.state[name] = value
+    ledger.add(callback_context.invocation_id, callback_context.agent_name, "cached_answers", 1)
+    logger.info(f"Answered {key!r} from the answer cache")
+    return types.Content(role="model", parts=[types.Part(text=answer.text)])
+
+
+def store_answer(callback_context: CallbackContext) -> Optional[types.Content]:
+    """after_agent_callback: caches the answer when it only depends on the query and catalog,
+    i.e. for a session's first product query whose tools were called without a cursor."""
+    state = callback_context.state
+    key = _query_key(callback_context)
+    version = state.get("temp:catalog_version")
+    outputs = [state.get(name) for name in ANSWER_KEYS]
+    if not key or not version or state.get("temp:answer_uncacheable") or not all(outputs):
+        return None
+    text = "\n\n".join(filter(None, [state.get("temp:answer_cards", ""), *outputs]))
+    user_id = state.get("user_id")
+    if user_id and user_id in text:
+        return None
+    cached_state = dict(zip(ANSWER_KEYS, outputs))
+    if state.get("last_result_ids"):
+        cached_state["last_result_ids"] = state["last_result_ids"]
+    answers.put(key, version, text, cached_state)
+    return None
@@ -1 +1,25 @@
+import os
+
 GEMINI_MODEL = "gemini-2.0-flash"
+# Model tiers for per-agent routing (see model_routing.py); MODEL_ROUTES overrides routes, e.g. "root=standard,order=strong"
+GEMINI_FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.0-flash-lite")
+GEMINI_STRONG_MODEL = os.getenv("GEMINI_STRONG_MODEL", "gemini-2.5-flash")
+MODEL_ROUTES = os.getenv("MODEL_ROUTES", "")
+
+# URL of a shared MCP server (e.g. http://mcp-server:8000/mcp); empty runs it as a stdio subprocess
+MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "")
+
+# Token budgets (estimated tokens, ~4 chars per token) enforced before each LLM call
+STATE_TOKEN_BUDGET = int(os.getenv("STATE_TOKEN_BUDGET", "1500"))
+TOOL_OUTPUT_TOKEN_BUDGET = int(os.getenv("TOOL_OUTPUT_TOKEN_BUDGET", "6000"))
+
+# Shared limiter for Gemini calls: concurrency adapts to 429s (AIMD) within this cap
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_BACKOFF_SECONDS = float(os.getenv("GEMINI_BACKOFF_SECONDS", "1"))
+# How long background calls (eco scoring) yield to interactive turns
+GEMINI_BACKGROUND_SLACK = float(os.getenv("GEMINI_BACKGROUND_SLACK", "2"))
+
+# Rendered answers of the product agents for repeated queries; also bounded by the catalog version
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "300"))
+ANSWER_CACHE_MAX = int(os.getenv("ANSWER_CACHE_MAX", "512"))
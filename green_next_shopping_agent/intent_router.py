@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from green_next_shopping_agent.token_budget import ledger
+
+logger = logging.getLogger(__name__)
+
+EMAIL = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+
+BROWSE = "sequencial_delegation_agent"
+ORDER = "mcp_product_order_agent"
+
+# Phrases per target agent; a turn is routed only when exactly one target matches
+INTENT_PATTERNS: Dict[str, List[re.Pattern]] = {
+    BROWSE: [
+        re.compile(r"\b(show|list|see|view|browse)\b.{0,20}\b(all|every|the)\b.{0,10}\bproducts?\b"),
+        re.compile(r"\ball products\b"),
+        re.compile(r"\b(search|find|look(ing)? for|show me)\b.{0,30}\b(product|item|mug|watch|bottle|bag|shirt|something)"),
+    ],
+    ORDER: [
+        re.compile(r"\badd\b.{0,40}\b(to|in|into)\b.{0,10}\b(my |the )?(cart|basket)\b"),
+        re.compile(r"\b(place|complete|submit)\b.{0,15}\border\b"),
+        re.compile(r"\bcheck ?out\b"),
+        re.compile(r"\b(show|view|see|list|what'?s in|empty|clear)\b.{0,30}\b(cart|basket)\b"),
+    ],
+}
+# Negations and questions about the options go to the model
+AMBIGUOUS = re.compile(r"\b(don'?t|do not|not now|not yet|cancel|instead|or)\b|\?\s*$")
+# Several requests in one message ("find a gift, then check out") go to the model
+MULTI_CLAUSE = re.compile(r"[,;]|\b(and|then|also|after|before)\b")
+# A message about the cart or an order is never a browsing request
+ORDER_NOUNS = re.compile(r"\b(cart|basket|check ?out|orders?)\b")
+
+
+def _latest_user_text(llm_request: LlmRequest) -> Optional[Tuple[str, bool]]:
+    """(text, has_image) of the latest content if it is a user message, else None."""
+    if not llm_request.contents:
+        return None
+    content = llm_request.contents[-1]
+    if content.role != "user" or not content.parts:
+        return None
+    if any(part.function_response for part in content.parts):
+        return None
+    text = " ".join(part.text for part in content.parts if part.text).strip()
+    has_image = any(part.inline_data and (part.inline_data.mime_type or "").startswith("image/") for part in content.parts)
+    return text, has_image
+
+
+def classify(text: str, has_image: bool = False) -> Optional[str]:
+    """Target agent for a user message, or None when it is not clear-cut."""
+    lowered = text.lower()
+    if has_image and not lowered:
+        return BROWSE
+    if not lowered or AMBIGUOUS.search(lowered) or MULTI_CLAUSE.search(lowered):
+        return None
+    matches = {agent for agent, patterns in INTENT_PATTERNS.items() if any(p.search(lowered) for p in patterns)}
+    if ORDER_NOUNS.search(lowered):
+        return ORDER if ORDER in matches else None
+    if has_image and not matches:
+        return BROWSE
+    return matches.pop() if len(matches) == 1 else None
+
+
+def _function_call(name: str, args: Dict[str, str]) -> LlmResponse:
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(name=name, args=args))]))
+
+
+def route_intent(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """before_model_callback for root_agent: answers clear-cut turns without the model.
+
+    An email address in the message becomes a set_user_id call while no user
+    is set yet; changing it later goes to the model. Once the user is known, browsing requests (or an uploaded photo) transfer to the
+    product agents and cart/order requests to the order agent. Anything else,
+    including follow-ups after a tool call, goes to the model.
+    """
+    latest = _latest_user_text(llm_request)
+    if latest is None:
+        return None
+    text, has_image = latest
+    tools = llm_request.tools_dict
+
+    email = EMAIL.search(text)
+    if email and "set_user_id" in tools and not callback_context.state.get("user_id"):
+        response = _function_call("set_user_id", {"email_id": email.group(0)})
+    else:
+        target = classify(text, has_image) if callback_context.state.get("user_id") else None
+        if target is None or "transfer_to_agent" not in tools:
+            return None
+        response = _function_call("transfer_to_agent", {"agent_name": target})
+
+    call = response.content.parts[0].function_call
+    logger.info(f"Routed {callback_context.agent_name} turn without the model: {call.name}({call.args})")
+    ledger.add(callback_context.invocation_id, callback_context.agent_name, "routed_turns", 1)
+    return response
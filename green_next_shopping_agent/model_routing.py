@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Dict, Optional
+
+from google.adk.models.llm_request import LlmRequest
+from google.genai import types
+
+from green_next_shopping_agent.constants import GEMINI_FAST_MODEL, GEMINI_MODEL, GEMINI_STRONG_MODEL, MODEL_ROUTES
+
+logger = logging.getLogger(__name__)
+
+TIERS = {"fast": GEMINI_FAST_MODEL, "standard": GEMINI_MODEL, "strong": GEMINI_STRONG_MODEL}
+
+# Route (agent, or agent.step) -> tier. Steps fall back to their agent's route.
+DEFAULT_ROUTES = {
+    # Greeting, email capture and delegation only
+    "root": "fast",
+    "product_details": "standard",
+    # search_by_image only matches colour histograms and layout thumbnails;
+    # when nothing looks alike the model has to identify the photo itself.
+    # Kept as its own route so photo turns show up separately in route_stats.
+    "product_details.image": "standard",
+    "order": "standard",
+    "greeness_analyzer": "strong",
+}
+
+# USD per million (input, output) tokens, for the cost estimate only
+PRICES_PER_M_TOKENS = {
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.0),
+}
+
+
+def parse_routes(spec: str) -> Dict[str, str]:
+    """Parses "root=fast,order=strong" into {"root": "fast", "order": "strong"}."""
+    routes = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        route, _, tier = item.partition("=")
+        if tier.strip() not in TIERS:
+            raise ValueError(f"Unknown model tier in MODEL_ROUTES: {item!r} (expected one of {', '.join(TIERS)})")
+        routes[route.strip()] = tier.strip()
+    return routes
+
+
+ROUTES = {**DEFAULT_ROUTES, **parse_routes(MODEL_ROUTES)}
+
+
+def _latest_user_image(llm_request: LlmRequest) -> bool:
+    if not llm_request.contents:
+        return False
+    content = llm_request.contents[-1]
+    return content.role == "user" and any(
+        part.inline_data and (part.inline_data.mime_type or "").startswith("image/") for part in content.parts or []
+    )
+
+
+def route_for(agent_route: str, llm_request: LlmRequest) -> str:
+    """Picks the most specific route for this call of an agent."""
+    if _latest_user_image(llm_request) and f"{agent_route}.image" in ROUTES:
+        return f"{agent_route}.image"
+    return agent_route
+
+
+def model_for(route: str, default: str) -> str:
+    tier = ROUTES.get(route) or ROUTES.get(route.split(".")[0])
+    return TIERS[tier] if tier else default
+
+
+def estimate_cost(model: str, usage: Optional[types.GenerateContentResponseUsageMetadata]) -> float:
+    prices = PRICES_PER_M_TOKENS.get(model)
+    if usage is None or prices is None:
+        return 0.0
+    return ((usage.prompt_token_count or 0) * prices[0] + (usage.candidates_token_count or 0) * prices[1]) / 1e6
+
+
+class RouteStats:
+    """Calls, latency and estimated cost per (route, model), to tune ROUTES."""
+
+    def __init__(self) -> None:
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: str, model: str, seconds: float, usage: Optional[types.GenerateContentResponseUsageMetadata]) -> None:
+        cost = estimate_cost(model, usage)
+        with self._lock:
+            stats = self._stats.setdefault(f"{route}:{model}", {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "cost_usd": 0.0})
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            stats["cost_usd"] += cost
+        logger.info(f"Model call {route} on {model}: {seconds * 1000:.0f} ms, ~${cost:.6f}")
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                key: {**stats, "avg_seconds": stats["seconds"] / stats["calls"]}
+                for key, stats in self._stats.items()
+            }
+
+
+route_stats = RouteStats()
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from typing import Any, AsyncGenerator, Dict, Iterator, List, Optional
+
+from google.adk.agents.base_agent import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events.event import Event
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_TOOLS = ("search_products", "semantic_search_products", "search_by_image", "filter_products", "list_products_page", "list_products")
+MAX_CARDS = int(os.getenv("PRODUCT_CARDS_MAX", "12"))
+DESCRIPTION_CHARS = 120
+
+
+def tool_payload(response: Any) -> Dict[str, Any]:
+    """The tool's own result from an MCP tool response.
+
+    Accepts the CallToolResult an after_tool_callback sees, its JSON dump, or
+    either wrapped as {"result": ...} the way ADK stores non-dict results in
+    function response events.
+    """
+    if isinstance(response, dict) and set(response) == {"result"}:
+        response = response["result"]
+    if hasattr(response, "model_dump"):
+        response = response.model_dump(mode="json", exclude_none=True)
+    if not isinstance(response, dict):
+        return {}
+    structured = response.get("structuredContent")
+    if isinstance(structured, dict):
+        return structured.get("result", structured) if set(structured) == {"result"} else structured
+    for item in response.get("content") or []:
+        if item.get("type") == "text":
+            try:
+                return json.loads(item["text"])
+            except (ValueError, KeyError):
+                pass
+    return response
+
+
+def products_in(payload: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield from payload.get("results") or []
+    for group in payload.get("categories") or []:
+        if isinstance(group, dict):
+            yield from group.get("products") or []
+
+
+def card(product: Dict[str, Any]) -> str:
+    price = product.get("price_usd", 0) + product.get("price_usd_nanos", 0) / 1e9
+    title = f"**{product.get('rank', '')}{'. ' if product.get('rank') else ''}{product.get('name', '')}** · {price:.2f} USD"
+    if product.get("eco_score") is not None:
+        title += f" · eco score {product['eco_score']:.0f}/100"
+    description = product.get("description", "")
+    if len(description) > DESCRIPTION_CHARS:
+        description = description[:DESCRIPTION_CHARS].rsplit(" ", 1)[0] + "…"
+    lines = [title]
+    if product.get("picture"):
+        lines.append(f"![{product.get('name', '')}]({product['picture']})")
+    lines.append(f"{description}  \n_{', '.join(product.get('categories') or [])}_ · id `{product.get('id', '')}`")
+    return "\n".join(lines)
+
+
+def cards_for(event: Event) -> Optional[str]:
+    """Markdown cards for the products in an event's search tool responses."""
+    products: List[Dict[str, Any]] = []
+    for response in event.get_function_responses():
+        if response.name in PRODUCT_TOOLS:
+            products.extend(products_in(tool_payload(response.response)))
+    return cards_text(products) if products else None
+
+
+def cards_text(products: List[Dict[str, Any]]) -> str:
+    shown = products[:MAX_CARDS]
+    text = "\n\n".join(card(p) for p in shown)
+    if len(products) > len(shown):
+        text += f"\n\n_…and {len(products) - len(shown)} more_"
+    return text
+
+
+class ProductCardStreamer(BaseAgent):
+    """Runs its sub-agent and shows product cards as soon as a search returns.
+
+    The cards are emitted as their own event right after the tool response,
+    ahead of the model's formatted answer, so the user sees results while the
+    model (and later the greenness analyzer) is still writing.
+    """
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        for agent in self.sub_agents:
+            async for event in agent.run_async(ctx):
+                yield event
+                cards = cards_for(event)
+                if cards:
+                    yield Event(
+                        invocation_id=ctx.invocation_id,
+                        author=self.name,
+                        branch=ctx.branch,
+                        content=types.Content(role="model", parts=[types.Part(text=cards)]),
+                    )
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from typing import AsyncGenerator, Dict, List, Tuple
+
+from google.adk.models.google_llm import Gemini
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai.errors import ClientError
+
+from green_next_shopping_agent.constants import (
+    GEMINI_BACKGROUND_SLACK,
+    GEMINI_BACKOFF_SECONDS,
+    GEMINI_MAX_CONCURRENCY,
+    GEMINI_MAX_RETRIES,
+)
+from green_next_shopping_agent.model_routing import model_for, route_for, route_stats
+
+logger = logging.getLogger(__name__)
+
+# Priorities are slack in seconds: a call is admitted in order of arrival + slack,
+# so background calls yield to interactive ones but still run within the slack.
+INTERACTIVE = 0.0
+BACKGROUND = GEMINI_BACKGROUND_SLACK
+
+MAX_BACKOFF_SECONDS = 30.0
+
+
+class AdaptiveLimiter:
+    """Shared AIMD concurrency limit with priority admission for model calls.
+
+    The limit grows by 1/limit per successful call and halves on a 429, which
+    also pauses admissions with exponential backoff. All agents run on one
+    event loop, so the state is only touched from that loop.
+    """
+
+    def __init__(self, max_concurrency: int, min_concurrency: int = 1) -> None:
+        self.limit = float(max_concurrency)
+        self._max = float(max_concurrency)
+        self._min = float(min_concurrency)
+        self.in_flight = 0
+        self._waiters: List[Tuple[float, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._throttled_in_row = 0
+        self._wakeup: asyncio.TimerHandle | None = None
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def _has_capacity(self, now: float) -> bool:
+        return self.in_flight < max(1, int(self.limit)) and now >= self._paused_until
+
+    def _wake(self) -> None:
+        self._wakeup = None
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._waiters and self._has_capacity(loop.time()):
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+        if self._waiters and self._wakeup is None and loop.time() < self._paused_until:
+            self._wakeup = loop.call_at(self._paused_until, self._wake)
+
+    async def acquire(self, priority: float = INTERACTIVE) -> float:
+        """Waits for a slot; returns the seconds spent queueing."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        if not self._waiters and self._has_capacity(started):
+            self.in_flight += 1
+            return 0.0
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (started + priority, next(self._seq), future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted and cancelled in the same tick: hand the slot on
+                self.release()
+            raise
+        return loop.time() - started
+
+    def release(self, throttled: bool = False) -> None:
+        loop = asyncio.get_running_loop()
+        self.in_flight -= 1
+        if throttled:
+            self.limit = max(self._min, self.limit / 2)
+            backoff = min(MAX_BACKOFF_SECONDS, GEMINI_BACKOFF_SECONDS * 2 ** self._throttled_in_row)
+            self._throttled_in_row += 1
+            self._paused_until = max(self._paused_until, loop.time() + backoff * random.uniform(0.5, 1.0))
+            logger.warning(f"Model rate limited, concurrency limit now {int(self.limit)}, pausing {backoff:.1f}s")
+        else:
+            self.limit = min(self._max, self.limit + 1 / self.limit)
+            self._throttled_in_row = 0
+        self._dispatch()
+
+    def record(self, label: str, queued_seconds: float, throttled: bool = False) -> None:
+        stats = self.stats.setdefault(label, {"calls": 0, "queued_ms": 0.0, "max_queued_ms": 0.0, "throttled": 0})
+        if throttled:
+            stats["throttled"] += 1
+            return
+        stats["calls"] += 1
+        stats["queued_ms"] += queued_seconds * 1000
+        stats["max_queued_ms"] = max(stats["max_queued_ms"], queued_seconds * 1000)
+
+
+limiter = AdaptiveLimiter(GEMINI_MAX_CONCURRENCY)
+
+
+class RateLimitedGemini(Gemini):
+    """Gemini whose calls share the process-wide limiter and model routing.
+
+    Each call goes to the model its route maps to (see model_routing), and
+    its latency and cost are recorded per route. A 429 halves the limit and
+    the call is retried after the backoff, unless part of a streamed
+    response was already yielded. google_search runs as grounding inside
+    the model call, so it is throttled with it.
+    """
+
+    priority: float = INTERACTIVE
+    route: str = ""
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        label = route_for(self.route, llm_request) if self.route else self.model
+        llm_request.model = model_for(label, llm_request.model or self.model)
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            queued = await limiter.acquire(self.priority)
+            limiter.record(label, queued)
+            if queued >= 0.001:
+                logger.info(f"{label} queued {queued * 1000:.0f} ms for a model slot (limit {int(limiter.limit)})")
+            throttled = yielded = False
+            started = time.monotonic()
+            try:
+                usage = None
+                async for response in super().generate_content_async(llm_request, stream):
+                    yielded = True
+                    if response.usage_metadata is not None and not response.partial:
+                        usage = response.usage_metadata
+                    yield response
+                route_stats.record(label, llm_request.model, time.monotonic() - started, usage)
+                return
+            except ClientError as e:
+                throttled = e.code == 429
+                if throttled:
+                    limiter.record(label, 0.0, throttled=True)
+                if not throttled or yielded or attempt == GEMINI_MAX_RETRIES:
+                    raise
+                logger.warning(f"{label} got 429, retry {attempt + 1}/{GEMINI_MAX_RETRIES}")
+            finally:
+                limiter.release(throttled)
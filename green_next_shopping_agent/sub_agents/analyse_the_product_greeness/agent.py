@@ -1,11 +1,13 @@
 from google.adk.agents.llm_agent import LlmAgent
 from green_next_shopping_agent.constants import GEMINI_MODEL
 from google.adk.tools import google_search
+from green_next_shopping_agent.token_budget import budgeted_instruction, record_prompt_tokens, record_model_usage
+from green_next_shopping_agent.rate_limiter import BACKGROUND, RateLimitedGemini
 
 product_greeness_analyzer = LlmAgent(
     name="ProductGreenessAnalyzer",
-    model=GEMINI_MODEL,
-    instruction="""
+    model=RateLimitedGemini(model=GEMINI_MODEL, priority=BACKGROUND, route="greeness_analyzer"),
+    instruction=budgeted_instruction("""
         You are an Eco-Friendliness Product Analyzer.
         Your role is to evaluate how environmentally friendly a product is, based on the following details:
 
@@ -16,7 +18,7 @@ product_greeness_analyzer = LlmAgent(
 
         Research:
 
-        Extract the key product description from {mcp_product_details}.
+        Extract the key product description from the Product Details above.
 
         Use the google_search tool to find similar products available in the market.
 
@@ -24,7 +26,7 @@ product_greeness_analyzer = LlmAgent(
 
         Example:
 
-        If {mcp_product_details} = “This gold-tone stainless steel watch will work with most of your outfits”,
+        If the product description is “This gold-tone stainless steel watch will work with most of your outfits”,
         → Search for: “gold-tone stainless steel watch”.
         → Compare eco-friendliness of similar watches.
 
@@ -62,8 +64,10 @@ product_greeness_analyzer = LlmAgent(
 
         “Would you like to add this product to your cart or place the order now? In bold with font size 24 and color #000000”
         → Capture their response and delegate the task to mcp_product_order_agent.
-    """,
+    """),
     description="Analyse and the product's eco friendliness",
     tools=[google_search],
-    output_key="analysed_product_greeness"
+    output_key="analysed_product_greeness",
+    before_model_callback=record_prompt_tokens,
+    after_model_callback=record_model_usage,
 )
\ No newline at end of file
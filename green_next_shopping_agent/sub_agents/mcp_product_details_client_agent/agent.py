@@ -1,10 +1,18 @@
 from google.adk.agents.llm_agent import LlmAgent
 from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset
-from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams
+from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams, StreamableHTTPConnectionParams
 from mcp import StdioServerParameters
 from pathlib import Path
 import logging
-from green_next_shopping_agent.constants import GEMINI_MODEL
+import os
+from green_next_shopping_agent.constants import GEMINI_MODEL, MCP_SERVER_URL
+from green_next_shopping_agent.token_budget import budgeted_instruction, record_prompt_tokens, record_model_usage, enforce_tool_budget
+from green_next_shopping_agent.rate_limiter import INTERACTIVE, RateLimitedGemini
+from green_next_shopping_agent.answer_cache import record_results
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.tool_context import ToolContext
+from typing import Any, Dict, Optional
+import base64
 logger = logging.getLogger(__name__)
 
 # IMPORTANT: Dynamically compute the absolute path to your server.py script
@@ -12,18 +20,58 @@ PATH_TO_MCP_SERVER_SCRIPT = str((Path(__file__).parent.parent.absolute() / "mcp_
 
 logger.info(PATH_TO_MCP_SERVER_SCRIPT)
 
+
+def attach_uploaded_image(tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext) -> Optional[Dict]:
+    # The model cannot echo the uploaded photo bytes, so search_by_image gets
+    # them straight from the user's message.
+    if tool.name != "search_by_image" or tool_context.user_content is None:
+        return None
+    for part in reversed(tool_context.user_content.parts or []):
+        blob = part.inline_data
+        if blob and blob.data and (blob.mime_type or "").startswith("image/"):
+            args["image_base64"] = base64.b64encode(blob.data).decode()
+            args.pop("image_url", None)
+            break
+    return None
+
+
+def attach_user_id(tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext) -> Optional[Dict]:
+    # Searches made for a known user are remembered server-side, so the order
+    # agent can add "item 2" by rank instead of resending product data.
+    if tool.name in ("search_products", "semantic_search_products", "search_by_image", "filter_products") and not args.get("user_id"):
+        user_id = tool_context.state.get("user_id")
+        if user_id:
+            args["user_id"] = user_id
+    return None
+
+
 mcp_product_details_agent=LlmAgent(
     name="mcp_product_details_agent",
-    model= GEMINI_MODEL,
+    model=RateLimitedGemini(model=GEMINI_MODEL, priority=INTERACTIVE, route="product_details"),
     description="Product details and prodict list agent",
-    instruction="""
+    instruction=budgeted_instruction("""
         You are a highly proactive and efficient agent for interacting with the Green Next Shopping MCP Tools.
-        You have access to the following tools: search_products, list_products.
+        You have access to the following tools: search_products, semantic_search_products, search_by_image, filter_products, get_ads, list_products, list_products_page.
 
-        🔹 1. Search Products (search_products) 
+        🔹 1. Search Products (search_products, search_by_image)
 
         Ask the user until the user provides either a photo or a text description of the product.
 
+        If the user provides a photo, call search_by_image right away (leave image_base64 empty, the uploaded photo is attached automatically)
+        and show its results. Only if it returns no results, identify the object as described below and call search_products.
+
+        If the user describes what they need in their own words (e.g. "eco water bottle", "something to keep coffee hot"),
+        call semantic_search_products once with their description instead of trying several rephrased searches.
+
+        If the user asks for products by category, price or order (e.g. "kitchen items under $20", "cheapest shoes"),
+        call filter_products with those constraints (categories, min_price/max_price in USD, sort_by, limit)
+        instead of listing the whole catalog. Mention the total and offer the facet counts as ways to narrow or widen the search.
+        If the user asks for a minimum eco score, pass min_eco_score too, but when the result has eco_scores_available false,
+        say that eco scores are not rated yet rather than presenting the results as filtered by eco score.
+
+        After showing search or filter results, call get_ads with the categories of the products shown and add at most two of the ads
+        under a "Sponsored" heading, preferring greener alternatives. Skip the section if no ads come back.
+
         Identify the product and call the search_products tool followin gthe below rules:
 
         If the user provides a photo, then you need to analyse the photo and give me the what is the object.
@@ -57,22 +105,25 @@ mcp_product_details_agent=LlmAgent(
 
         categories
 
-        picture (as an image link)
         
         Use bullet points.
 
         Make the heading in bold.
 
-        Mandatory: Put the image link in the output.
+        Product cards with the picture, price and eco score are shown to the user automatically as soon as a search or
+        listing tool returns, so do not repeat the image links; add the details below and your recommendation.
 
         If no product found → show “No product found”.
 
         Add a very suitable heading when displaying the product details in bold and in a different color.
 
-        🔹 2. List Products (list_products)
+        🔹 2. List Products (list_products_page)
+
+        If the user wants to see the list of products, then you need to call the list_products_page tool with cursor 0.
+        The products come back grouped by category, one page at a time.
+        Show each page to the user as soon as it arrives, then call list_products_page again with next_cursor
+        until next_cursor is null. Use list_products only if list_products_page is not available.
 
-        If the user wants to see the list of products, then you need to call the list_products tool.
-        
 
         Output Rules:
 
@@ -90,65 +141,42 @@ mcp_product_details_agent=LlmAgent(
 
         categories
 
-        picture (as an image link)
         
         Use bullet points.
 
         Make the heading in bold.
 
-        **Mandatory: Put the image link in the output.
+        The product cards (with pictures) of each page are shown automatically; do not repeat the image links.
 
         **Mandetory: Show all the products in the output product category wise.
         example:
         Product Category: Clothing
         - Product 1
-             id: "<id>",
-            "name": "<name>",
-            "description": "<description>",
-            "picture": "<image_link>",
-            "price_usd": "<price>"
-        - Product 2
             id: "<id>",
             "name": "<name>",
             "description": "<description>",
-            "picture": "<image_link>",
-            "price_usd": "<price>"
-        - Product 3
-            id: "<id>",
-            "name": "<name>",
-            "description": "<description>",
-            "picture": "<image_link>",
             "price_usd": "<price>"
+        - Product 2 (same fields as above)
         Product Category: Electronics
-        - Product 1
-            id: "<id>",
-            "name": "<name>",
-            "description": "<description>",
-            "picture": "<image_link>",
-            "price_usd": "<price>"
-        - Product 2
-            id: "<id>",
-            "name": "<name>",
-            "description": "<description>",
-            "picture": "<image_link>",
-            "price_usd": "<price>"
-        - Product 3
-            id: "<id>",
-            "name": "<name>",
-            "description": "<description>",
-            "picture": "<image_link>",
-            "price_usd": "<price>"
+        - Product 1 (same fields as above)
 
-        """,
+        """),
     tools=[
         MCPToolset(
-            connection_params=StdioConnectionParams(
+            # A shared MCP server over HTTP when MCP_SERVER_URL is set, else a stdio subprocess
+            connection_params=StreamableHTTPConnectionParams(url=MCP_SERVER_URL) if MCP_SERVER_URL else StdioConnectionParams(
                 server_params=StdioServerParameters(
                     command="python3",
                     args=[PATH_TO_MCP_SERVER_SCRIPT],
+                    # Forward service endpoints and keys; MCP only passes a minimal env by default
+                    env=dict(os.environ),
                 )
             )
         ),
     ],
     output_key="mcp_product_details",
+    before_model_callback=record_prompt_tokens,
+    after_model_callback=record_model_usage,
+    before_tool_callback=[attach_uploaded_image, attach_user_id],
+    after_tool_callback=[record_results, enforce_tool_budget],
 )
\ No newline at end of file
@@ -1,12 +1,16 @@
 from google.adk.agents.llm_agent import LlmAgent
 from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset
-from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams
+from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams, StreamableHTTPConnectionParams
 from mcp import StdioServerParameters
 from pathlib import Path
 import logging
-from green_next_shopping_agent.constants import GEMINI_MODEL
+import os
+from green_next_shopping_agent.constants import GEMINI_MODEL, MCP_SERVER_URL
+from green_next_shopping_agent.token_budget import budgeted_instruction, record_prompt_tokens, record_model_usage, enforce_tool_budget
+from green_next_shopping_agent.rate_limiter import INTERACTIVE, RateLimitedGemini
 from google.adk.tools.tool_context import ToolContext
-from typing import Dict, Any
+from typing import Any, Dict, Optional
+from google.adk.tools.base_tool import BaseTool
 import re
 
 logger = logging.getLogger(__name__)
@@ -16,13 +20,29 @@ PATH_TO_MCP_SERVER_SCRIPT = str((Path(__file__).parent.parent.absolute() / "mcp_
 
 logger.info(PATH_TO_MCP_SERVER_SCRIPT)
 
+
+def resolve_rank(tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext) -> Optional[Dict]:
+    # "item 2" refers to the results this session last saw, which may have
+    # come from the answer cache rather than a search the server remembers.
+    result_ids = tool_context.state.get("last_result_ids") or []
+    rank = args.get("rank") or 0
+    if tool.name == "add_item" and not args.get("product_id") and 1 <= rank <= len(result_ids):
+        args["product_id"] = result_ids[rank - 1]
+        args.pop("rank")
+    return None
+
+
 mcp_product_order_agent=LlmAgent(
     name="mcp_product_order_agent",
-    model= GEMINI_MODEL,
+    model=RateLimitedGemini(model=GEMINI_MODEL, priority=INTERACTIVE, route="order"),
     description="Product add and place order agent",
-    instruction="""
+    instruction=budgeted_instruction("""
         You are a highly proactive and efficient agent for interacting with the Green Next Shopping MCP Tools.
-        You have access to the following tools:  add_item. If the user requests to add to cart, you need to call the add_item tool.
+        You have access to the following tools:  add_item, get_cart, empty_cart, quote_shipping, prefetch_shipping_quote, set_currency_preference, place_order. If the user requests to add to cart, you need to call the add_item tool.
+        If the user wants to see their cart, call get_cart with {user_id} and show the items it returns; do not rebuild the cart from the conversation.
+        If the user wants to clear their cart, call empty_cart with {user_id}.
+        If the user refers to a product by its position in the last search results ("item 2"), call add_item with rank set to that number instead of product_id.
+        If the user states a preferred currency, call set_currency_preference with {user_id}; leave user_currency empty in place_order to use it.
 
         🔹 1. Add Item (add_item)
 
@@ -51,6 +71,8 @@ mcp_product_order_agent=LlmAgent(
 
         Do not prompt for missing values unless necessary.
 
+        Give every add_item and place_order request its own idempotency_key (e.g. "<user_id>-<product_id>-<n>") and reuse the same key only when retrying a call that timed out or failed.
+
         Output Rules:
         On success → Show “✅ Item successfully added to cart”. 
 
@@ -85,6 +107,8 @@ mcp_product_order_agent=LlmAgent(
             “Postal code (aka secret map code):”
             Validation: country-dependent pattern; otherwise 3–12 alphanumeric chars.
             If invalid → “That doesn’t look like a valid postal code. Can you double-check?
+            As soon as country, state and zip code are known, call prefetch_shipping_quote with {user_id} and them (it returns immediately),
+            then call quote_shipping and show the shipping cost and order total before asking for card details.
         - credit card number **MAndetory** Tell the user that their details is safe with US
             Ask the user to provide the credit card details in the following format:
             4111111111111111 (16 digits)(**Mandetory**)
@@ -97,7 +121,7 @@ mcp_product_order_agent=LlmAgent(
         
         {
             "user_id": {user_id},
-            "user_currency": "USD",
+            "user_currency": "<EMPTY_IF_CURRENCY_PREFERENCE_SET_ELSE_USD>",
             "address": {
                 "street_address": "<USER_PROVIDED>",
                 "city": "<USER_PROVIDED>",
@@ -123,7 +147,7 @@ mcp_product_order_agent=LlmAgent(
 
         If mandatory details are missing → show “⚠️ Order details incomplete. Please provide missing information.”
 
-        Currency is always USD.
+        Currency is USD unless the user set a currency preference.
 
         Output Rules:
 
@@ -140,16 +164,23 @@ mcp_product_order_agent=LlmAgent(
         On failure → Show “❌ Failed to place order”.
 
     
-        """,
+        """),
     tools=[
         MCPToolset(
-            connection_params=StdioConnectionParams(
+            # A shared MCP server over HTTP when MCP_SERVER_URL is set, else a stdio subprocess
+            connection_params=StreamableHTTPConnectionParams(url=MCP_SERVER_URL) if MCP_SERVER_URL else StdioConnectionParams(
                 server_params=StdioServerParameters(
                     command="python3",
                     args=[PATH_TO_MCP_SERVER_SCRIPT],
+                    # Forward service endpoints and keys; MCP only passes a minimal env by default
+                    env=dict(os.environ),
                 )
             )
         ),
     ],
     output_key="mcp_product_order_details",
+    before_model_callback=record_prompt_tokens,
+    after_model_callback=record_model_usage,
+    before_tool_callback=resolve_rank,
+    after_tool_callback=enforce_tool_budget,
 )
\ No newline at end of file
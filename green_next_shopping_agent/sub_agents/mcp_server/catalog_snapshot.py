@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import demo_pb2
+
+from grpc_clients import ProductCatalogClient
+
+UNCATEGORIZED = "other"
+NANOS = 1_000_000_000
+
+
+class StringPool:
+    """Immutable strings stored as one UTF-8 blob plus int64 offsets.
+
+    The blob may be any bytes-like buffer, e.g. a view of a mapped snapshot.
+    """
+
+    __slots__ = ("_blob", "_offsets")
+
+    def __init__(self, strings: Iterable[str]) -> None:
+        encoded = [s.encode() for s in strings]
+        self._offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=self._offsets[1:])
+        self._blob = b"".join(encoded)
+
+    @classmethod
+    def from_buffers(cls, blob: Any, offsets: np.ndarray) -> "StringPool":
+        pool = cls.__new__(cls)
+        pool._blob = memoryview(blob)
+        pool._offsets = offsets
+        return pool
+
+    def buffers(self) -> Tuple[np.ndarray, np.ndarray]:
+        return np.frombuffer(self._blob, dtype=np.uint8), self._offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return str(self._blob[self._offsets[row]:self._offsets[row + 1]], "utf-8")
+
+    def take(self, rows: np.ndarray) -> List[str]:
+        blob = self._blob
+        return [str(blob[start:end], "utf-8") for start, end in zip(self._offsets[rows].tolist(), self._offsets[rows + 1].tolist())]
+
+    def __iter__(self) -> Iterator[str]:
+        blob, offsets = self._blob, self._offsets.tolist()
+        return (str(blob[start:end], "utf-8") for start, end in zip(offsets, offsets[1:]))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._blob) + self._offsets.nbytes
+
+
+class CatalogView:
+    """Immutable columnar copy of one ListProductsResponse.
+
+    Rows are ordered by primary category so pages group naturally. Prices are
+    int64 nanos, text columns are string pools and each row points at an
+    interned category set (products share a handful of combinations), so a
+    category filter is a mask over sets indexed by row. Filters run over the
+    arrays and dicts are only built for the rows a tool returns.
+    """
+
+    def __init__(self, response: demo_pb2.ListProductsResponse) -> None:
+        products = response.products
+        primary_names = [p.categories[0] if p.categories else UNCATEGORIZED for p in products]
+        order = sorted(range(len(products)), key=lambda i: (primary_names[i], i))
+        ordered = [products[i] for i in order]
+        n = len(ordered)
+
+        self.ids = StringPool(p.id for p in ordered)
+        self.names = StringPool(p.name for p in ordered)
+        self.descriptions = StringPool(p.description for p in ordered)
+        self.pictures = StringPool(p.picture for p in ordered)
+        self.price_nanos = np.fromiter(
+            (p.price_usd.units * NANOS + p.price_usd.nanos for p in ordered), dtype=np.int64, count=n
+        )
+
+        self.category_names: List[str] = []
+        self._category_ids: Dict[str, int] = {}
+        # category_sets[k] holds interned category ids; category_set[row] is k
+        self.category_sets: List[Tuple[int, ...]] = []
+        set_ids: Dict[Tuple[int, ...], int] = {}
+        self.category_set = np.zeros(n, dtype=np.int32)
+        for row, p in enumerate(ordered):
+            key = tuple(self._intern(c) for c in p.categories)
+            set_id = set_ids.get(key)
+            if set_id is None:
+                set_id = set_ids[key] = len(self.category_sets)
+                self.category_sets.append(key)
+            self.category_set[row] = set_id
+        self._set_names = [[self.category_names[c] for c in ids] for ids in self.category_sets]
+        self.primary = np.fromiter((self._intern(primary_names[i]) for i in order), dtype=np.int32, count=n)
+
+        # Sorted fixed-width ids for binary-search lookups without a dict
+        id_array = np.array([p.id.encode() for p in ordered], dtype=bytes) if n else np.array([], dtype="S1")
+        self._id_order = np.argsort(id_array, kind="stable").astype(np.int32)
+        self._sorted_ids = id_array[self._id_order]
+        self.version = self._digest()
+
+    def _digest(self) -> str:
+        """Content hash, so caches built on this catalog can tell when it changed."""
+        digest = hashlib.blake2b(digest_size=8)
+        for name in self.POOLS:
+            blob, offsets = getattr(self, name).buffers()
+            digest.update(blob)
+            digest.update(offsets)
+        digest.update(self.price_nanos)
+        digest.update(self.category_set)
+        digest.update("\0".join(self.category_names).encode())
+        return digest.hexdigest()
+
+    POOLS = ("ids", "names", "descriptions", "pictures")
+    ARRAYS = ("price_nanos", "category_set", "primary", "_id_order", "_sorted_ids")
+
+    def columns(self) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """The arrays and JSON metadata from_columns rebuilds the view from."""
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        for name in self.POOLS:
+            arrays[f"{name}.blob"], arrays[f"{name}.offsets"] = getattr(self, name).buffers()
+        return arrays, {"category_names": self.category_names, "category_sets": self.category_sets, "version": self.version}
+
+    @classmethod
+    def from_columns(cls, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]) -> "CatalogView":
+        """Wraps the arrays without copying, so mapped arrays stay mapped."""
+        view = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(view, name, arrays[name])
+        for name in cls.POOLS:
+            setattr(view, name, StringPool.from_buffers(arrays[f"{name}.blob"], arrays[f"{name}.offsets"]))
+        view.category_names = list(meta["category_names"])
+        view._category_ids = {name: i for i, name in enumerate(view.category_names)}
+        view.category_sets = [tuple(ids) for ids in meta["category_sets"]]
+        view._set_names = [[view.category_names[c] for c in ids] for ids in view.category_sets]
+        view.version = meta.get("version") or view._digest()
+        return view
+
+    def _intern(self, category: str) -> int:
+        category_id = self._category_ids.get(category)
+        if category_id is None:
+            category_id = self._category_ids[category] = len(self.category_names)
+            self.category_names.append(category)
+        return category_id
+
+    def __len__(self) -> int:
+        return len(self.price_nanos)
+
+    def row(self, product_id: str) -> Optional[int]:
+        key = product_id.encode()
+        i = int(np.searchsorted(self._sorted_ids, key))
+        if i < len(self._sorted_ids) and self._sorted_ids[i] == key:
+            return int(self._id_order[i])
+        return None
+
+    def row_categories(self, row: int) -> List[str]:
+        return list(self._set_names[self.category_set[row]])
+
+    def to_dict(self, row: int, picture_prefix: str = "") -> dict[str, Any]:
+        """Same shape as converters.product_to_dict."""
+        units, nanos = divmod(int(self.price_nanos[row]), NANOS)
+        return {
+            "id": self.ids[row],
+            "name": self.names[row],
+            "description": self.descriptions[row],
+            "picture": picture_prefix + self.pictures[row],
+            "price_usd": units,
+            "price_usd_nanos": nanos,
+            "categories": self.row_categories(row),
+        }
+
+    def to_dicts(self, rows: Sequence[int], picture_prefix: str = "") -> List[dict[str, Any]]:
+        """to_dict for many rows, reading each column once."""
+        rows = np.asarray(rows, dtype=np.intp)
+        units, nanos = np.divmod(self.price_nanos[rows], NANOS)
+        set_names = self._set_names
+        return [
+            {
+                "id": product_id,
+                "name": name,
+                "description": description,
+                "picture": picture_prefix + picture,
+                "price_usd": u,
+                "price_usd_nanos": n,
+                "categories": list(set_names[k]),
+            }
+            for product_id, name, description, picture, u, n, k in zip(
+                self.ids.take(rows), self.names.take(rows), self.descriptions.take(rows), self.pictures.take(rows),
+                units.tolist(), nanos.tolist(), self.category_set[rows].tolist(),
+            )
+        ]
+
+    def get(self, product_id: str, picture_prefix: str = "") -> Optional[dict[str, Any]]:
+        row = self.row(product_id)
+        return None if row is None else self.to_dict(row, picture_prefix)
+
+    def categories(self) -> List[str]:
+        return [self.category_names[c] for c in dict.fromkeys(self.primary.tolist())]
+
+    def category_id(self, category: str) -> Optional[int]:
+        category_id = self._category_ids.get(category)
+        if category_id is None:
+            lowered = category.lower()
+            category_id = next((i for i, name in enumerate(self.category_names) if name.lower() == lowered), None)
+        return category_id
+
+    def positions(self, category: str = "") -> np.ndarray:
+        if not category:
+            return np.arange(len(self), dtype=np.int32)
+        category_id = self.category_id(category)
+        if category_id is None:
+            return np.zeros(0, dtype=np.int32)
+        return np.flatnonzero(self.primary == category_id).astype(np.int32)
+
+    def category_mask(self, categories: Sequence[str]) -> np.ndarray:
+        """Boolean per row: in any of the given categories, primary or not."""
+        wanted = {c for c in map(self.category_id, categories) if c is not None}
+        set_matches = np.fromiter((not wanted.isdisjoint(ids) for ids in self.category_sets), dtype=bool, count=len(self.category_sets))
+        return set_matches[self.category_set]
+
+    def category_counts(self, rows: np.ndarray) -> Dict[str, int]:
+        """Number of the given rows in each category."""
+        per_set = np.bincount(self.category_set[rows], minlength=len(self.category_sets)).tolist()
+        counts = dict.fromkeys(self.category_names, 0)
+        for names, count in zip(self._set_names, per_set):
+            for name in names:
+                counts[name] += count
+        return {name: count for name, count in counts.items() if count}
+
+    def filter(self, categories: Sequence[str] = (), min_price: Optional[float] = None, max_price: Optional[float] = None) -> np.ndarray:
+        """Rows in any of the given categories within the USD price range."""
+        mask = np.ones(len(self), dtype=bool)
+        if categories:
+            mask &= self.category_mask(categories)
+        if min_price is not None:
+            mask &= self.price_nanos >= round(min_price * NANOS)
+        if max_price is not None:
+            mask &= self.price_nanos <= round(max_price * NANOS)
+        return np.flatnonzero(mask).astype(np.int32)
+
+    def chunks(self, positions: np.ndarray) -> Iterator[Tuple[str, List[int]]]:
+        """Yields (primary category, rows) groups for the given ordered rows."""
+        rows = positions.tolist()
+        primary = self.primary[positions].tolist()
+        start = 0
+        for i in range(1, len(rows) + 1):
+            if i == len(rows) or primary[i] != primary[start]:
+                yield self.category_names[primary[start]], rows[start:i]
+                start = i
+
+    @property
+    def nbytes(self) -> int:
+        pools = self.ids.nbytes + self.names.nbytes + self.descriptions.nbytes + self.pictures.nbytes
+        arrays = (self.price_nanos, self.category_set, self.primary, self._id_order, self._sorted_ids)
+        return pools + sum(a.nbytes for a in arrays)
+
+
+class CatalogSnapshot:
+    """Shares one ListProducts result across tool calls for ttl_seconds."""
+
+    def __init__(self, client_factory: Callable[[], ProductCatalogClient], ttl_seconds: float = 300.0) -> None:
+        self._client_factory = client_factory
+        self._ttl_seconds = ttl_seconds
+        self._view: Optional[CatalogView] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> CatalogView:
+        with self._lock:
+            if self._view is None or time.monotonic() - self._loaded_at > self._ttl_seconds:
+                client = self._client_factory()
+                try:
+                    self._view = CatalogView(client.list_products())
+                finally:
+                    client.close()
+                self._loaded_at = time.monotonic()
+            return self._view
+
+    def peek(self) -> Optional[Tuple[CatalogView, float]]:
+        """The current view and its age in seconds, without loading."""
+        with self._lock:
+            if self._view is None:
+                return None
+            return self._view, time.monotonic() - self._loaded_at
+
+    def seed(self, view: CatalogView, age_seconds: float = 0.0) -> None:
+        """Installs a view loaded elsewhere (a snapshot) as if fetched age_seconds ago."""
+        with self._lock:
+            self._view = view
+            self._loaded_at = time.monotonic() - age_seconds
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._view = None
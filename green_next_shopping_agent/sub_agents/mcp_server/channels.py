@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import itertools
+import logging
+import os
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import grpc
+
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+
+# "round_robin" or "least_outstanding" spread calls over every address the
+# target resolves to (a headless service returns one per pod); "none" leaves
+# a single gRPC channel that a ClusterIP pins to one pod.
+GRPC_LOAD_BALANCING = os.getenv("GRPC_LOAD_BALANCING", "round_robin")
+GRPC_RESOLVE_INTERVAL = float(os.getenv("GRPC_RESOLVE_INTERVAL", "30"))
+
+_COMPRESSION = {
+    "": None,
+    "none": None,
+    "gzip": grpc.Compression.Gzip,
+    "deflate": grpc.Compression.Deflate,
+}
+
+
+def _compression(env_var: str) -> Optional[grpc.Compression]:
+    value = os.getenv(env_var, "none").strip().lower()
+    if value not in _COMPRESSION:
+        logger.warning(f"Unknown {env_var}={value!r} (expected one of {', '.join(filter(None, _COMPRESSION))}), sending uncompressed")
+        return None
+    return _COMPRESSION[value]
+
+
+@dataclass(frozen=True)
+class ChannelProfile:
+    """Channel arguments for one class of RPC traffic."""
+
+    name: str
+    compression: Optional[grpc.Compression] = None
+    max_receive_message_length: int = 4 * _MB
+    max_send_message_length: int = 4 * _MB
+    # Initial HTTP/2 stream window; larger lets a big response stream without
+    # waiting for WINDOW_UPDATEs. BDP probing grows it further at runtime.
+    lookahead_bytes: int = 64 * 1024
+    keepalive_time_ms: int = 30_000
+    keepalive_timeout_ms: int = 10_000
+    lb_policy: str = "round_robin"
+    extra: Tuple[Tuple[str, object], ...] = field(default_factory=tuple)
+
+    def options(self) -> List[Tuple[str, object]]:
+        return [
+            ("grpc.max_receive_message_length", self.max_receive_message_length),
+            ("grpc.max_send_message_length", self.max_send_message_length),
+            ("grpc.http2.lookahead_bytes", self.lookahead_bytes),
+            ("grpc.http2.bdp_probe", 1),
+            ("grpc.keepalive_time_ms", self.keepalive_time_ms),
+            ("grpc.keepalive_timeout_ms", self.keepalive_timeout_ms),
+            ("grpc.keepalive_permit_without_calls", 1),
+            ("grpc.http2.max_pings_without_data", 0),
+            ("grpc.lb_policy_name", self.lb_policy),
+            *self.extra,
+        ]
+
+
+# Defaults picked with benchmarks/bench_channel_profiles.py: listing the
+# catalog is one large response, so it gets a big receive limit and stream
+# window; cart and checkout RPCs are tiny and latency bound and keep the gRPC
+# defaults. Response compression is chosen by the server (the client always
+# advertises gzip); for a 10k-product listing gzip shrinks 1.5 MiB to ~110 KiB
+# but costs ~11ms of CPU, so it only pays off on links slower than ~1 Gbit/s.
+# The compression setting here applies to what the client sends.
+PROFILES: Dict[str, ChannelProfile] = {
+    "catalog": ChannelProfile(
+        name="catalog",
+        compression=_compression("GRPC_CATALOG_COMPRESSION"),
+        max_receive_message_length=int(os.getenv("GRPC_CATALOG_MAX_RECEIVE_MB", "64")) * _MB,
+        lookahead_bytes=int(os.getenv("GRPC_CATALOG_LOOKAHEAD_KB", "1024")) * 1024,
+        lb_policy=os.getenv("GRPC_LB_POLICY", "round_robin"),
+    ),
+    "default": ChannelProfile(
+        name="default",
+        compression=_compression("GRPC_DEFAULT_COMPRESSION"),
+        lb_policy=os.getenv("GRPC_LB_POLICY", "round_robin"),
+    ),
+}
+
+
+def create_channel(target: str, profile: ChannelProfile) -> grpc.Channel:
+    return grpc.insecure_channel(target, options=profile.options(), compression=profile.compression)
+
+
+class _Endpoint:
+    __slots__ = ("address", "channel", "outstanding", "callables")
+
+    def __init__(self, address: str, channel: grpc.Channel) -> None:
+        self.address = address
+        self.channel = channel
+        self.outstanding = 0
+        self.callables: Dict[Tuple, Any] = {}
+
+
+def resolve(target: str) -> List[str]:
+    """All host:port endpoints the target's host name resolves to, in DNS order."""
+    host, _, port = target.rpartition(":")
+    infos = socket.getaddrinfo(host.strip("[]"), port, type=socket.SOCK_STREAM)
+    addresses = dict.fromkeys(info[4][0] for info in infos)
+    return [f"[{a}]:{port}" if ":" in a else f"{a}:{port}" for a in addresses]
+
+
+class _BalancedUnaryUnary:
+    def __init__(self, balancer: "BalancedChannel", key: Tuple) -> None:
+        self._balancer = balancer
+        self._key = key
+
+    def _invoke(self, attr: str, request: Any, args: Tuple, kwargs: Dict[str, Any]) -> Any:
+        endpoint = self._balancer._acquire()
+        try:
+            method = endpoint.callables.get(self._key)
+            if method is None:
+                method = endpoint.callables[self._key] = endpoint.channel.unary_unary(*self._key)
+            return getattr(method, attr)(request, *args, **kwargs)
+        finally:
+            self._balancer._release(endpoint)
+
+    def __call__(self, request: Any, *args: Any, **kwargs: Any) -> Any:
+        return self._invoke("__call__", request, args, kwargs)
+
+    def with_call(self, request: Any, *args: Any, **kwargs: Any) -> Any:
+        return self._invoke("with_call", request, args, kwargs)
+
+
+class BalancedChannel(grpc.Channel):
+    """Client-side load balancing over one channel per resolved endpoint.
+
+    Each unary call picks an endpoint round-robin or by fewest outstanding
+    calls. The target is re-resolved in the background every
+    resolve_interval seconds; endpoints that disappear are closed once idle.
+    Streaming calls are pinned to the endpoint picked when they start.
+    Connectivity subscribers follow every endpoint, including later ones.
+    """
+
+    def __init__(self, target: str, profile: ChannelProfile, policy: str = GRPC_LOAD_BALANCING, resolve_interval: float = GRPC_RESOLVE_INTERVAL) -> None:
+        self.target = target
+        self._profile = profile
+        self._least_outstanding = policy == "least_outstanding"
+        self._resolve_interval = resolve_interval
+        self._lock = threading.Lock()
+        self._endpoints: List[_Endpoint] = []
+        self._retired: List[_Endpoint] = []
+        self._counter = itertools.count()
+        self._resolving = False
+        self._next_resolve = 0.0
+        self._subscribers: List[Tuple[Any, bool]] = []
+        self._closed = False
+        self._update(self._resolve())
+
+    def _resolve(self) -> List[str]:
+        try:
+            return resolve(self.target)
+        except OSError as e:
+            logger.warning(f"Could not resolve {self.target}: {e}")
+            return []
+
+    def _update(self, addresses: List[str]) -> None:
+        with self._lock:
+            self._next_resolve = time.monotonic() + self._resolve_interval
+            self._resolving = False
+            if self._closed:
+                return
+            if not addresses:
+                if self._endpoints:
+                    return  # keep the last known endpoints
+                # Let gRPC resolve the target itself until DNS answers
+                addresses = [self.target]
+            current = {e.address: e for e in self._endpoints}
+            if list(current) == addresses:
+                return
+            self._endpoints = [current.get(a) or self._open_endpoint(a) for a in addresses]
+            self._retired.extend(e for a, e in current.items() if a not in addresses)
+            logger.info(f"{self.target} balanced over {len(self._endpoints)} endpoints")
+            self._close_idle_retired()
+
+    def _open_endpoint(self, address: str) -> _Endpoint:
+        endpoint = _Endpoint(address, create_channel(address, self._profile))
+        for callback, try_to_connect in self._subscribers:
+            endpoint.channel.subscribe(callback, try_to_connect)
+        return endpoint
+
+    def _check_open(self) -> None:
+        if self._closed or not self._endpoints:
+            raise ValueError(f"Channel to {self.target} is closed")
+
+    def _close_idle_retired(self) -> None:
+        idle = [e for e in self._retired if e.outstanding == 0]
+        self._retired = [e for e in self._retired if e.outstanding]
+        for endpoint in idle:
+            endpoint.channel.close()
+
+    def _refresh(self) -> None:
+        self._update(self._resolve())
+
+    def _acquire(self) -> _Endpoint:
+        with self._lock:
+            if not self._resolving and time.monotonic() >= self._next_resolve:
+                self._resolving = True
+                threading.Thread(target=self._refresh, daemon=True).start()
+            self._check_open()
+            endpoints = self._endpoints
+            start = next(self._counter) % len(endpoints)
+            endpoint = endpoints[start]
+            if self._least_outstanding:
+                for i in range(1, len(endpoints)):
+                    candidate = endpoints[(start + i) % len(endpoints)]
+                    if candidate.outstanding < endpoint.outstanding:
+                        endpoint = candidate
+            endpoint.outstanding += 1
+            return endpoint
+
+    def _release(self, endpoint: _Endpoint) -> None:
+        with self._lock:
+            endpoint.outstanding -= 1
+            if self._retired:
+                self._close_idle_retired()
+
+    def outstanding(self) -> Dict[str, int]:
+        with self._lock:
+            return {e.address: e.outstanding for e in self._endpoints}
+
+    def unary_unary(self, method, request_serializer=None, response_deserializer=None, _registered_method=False):
+        return _BalancedUnaryUnary(self, (method, request_serializer, response_deserializer, _registered_method))
+
+    def _pinned(self) -> grpc.Channel:
+        with self._lock:
+            self._check_open()
+            return self._endpoints[next(self._counter) % len(self._endpoints)].channel
+
+    def unary_stream(self, *args, **kwargs):
+        return self._pinned().unary_stream(*args, **kwargs)
+
+    def stream_unary(self, *args, **kwargs):
+        return self._pinned().stream_unary(*args, **kwargs)
+
+    def stream_stream(self, *args, **kwargs):
+        return self._pinned().stream_stream(*args, **kwargs)
+
+    def subscribe(self, callback, try_to_connect=False):
+        """Calls back with the connectivity changes of each endpoint."""
+        with self._lock:
+            self._subscribers.append((callback, try_to_connect))
+            endpoints = list(self._endpoints)
+        for endpoint in endpoints:
+            endpoint.channel.subscribe(callback, try_to_connect)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [(c, t) for c, t in self._subscribers if c is not callback]
+            endpoints = self._endpoints + self._retired
+        for endpoint in endpoints:
+            endpoint.channel.unsubscribe(callback)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._subscribers = []
+            endpoints, self._endpoints = self._endpoints + self._retired, []
+            self._retired = []
+        for endpoint in endpoints:
+            endpoint.channel.close()
+
+
+def _balanceable(target: str) -> bool:
+    host, _, port = target.rpartition(":")
+    return GRPC_LOAD_BALANCING in ("round_robin", "least_outstanding") and "/" not in target and bool(host) and port.isdigit()
+
+
+class ChannelPool:
+    """One long-lived channel per (target, profile), shared by all clients.
+
+    Reusing the channel keeps its HTTP/2 connection, keepalive and flow
+    control state warm instead of reconnecting on every tool call.
+    """
+
+    def __init__(self) -> None:
+        self._channels: Dict[Tuple[str, str], grpc.Channel] = {}
+        self._lock = threading.Lock()
+
+    def get(self, target: str, profile: str = "default") -> grpc.Channel:
+        key = (target, profile)
+        with self._lock:
+            channel = self._channels.get(key)
+            if channel is None:
+                logger.info(f"Opening {profile} channel to {target}")
+                if _balanceable(target):
+                    channel = BalancedChannel(target, PROFILES[profile])
+                else:
+                    channel = create_channel(target, PROFILES[profile])
+                self._channels[key] = channel
+            return channel
+
+    def close_all(self) -> None:
+        with self._lock:
+            channels, self._channels = list(self._channels.values()), {}
+        for channel in channels:
+            channel.close()
+
+
+pool = ChannelPool()
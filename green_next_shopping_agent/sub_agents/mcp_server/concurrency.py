@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+from typing import Any, Callable, Dict, Optional
+
+import anyio
+from fastmcp.exceptions import ToolError
+from fastmcp.server.middleware import CallNext, Middleware, MiddlewareContext
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+def parse_limits(spec: str) -> Dict[str, int]:
+    """Parses "place_order=4,list_products=2" into {"place_order": 4, ...}."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        limits[name.strip()] = int(value)
+    return limits
+
+
+class ToolConcurrencyLimiter(Middleware):
+    """Caps concurrent tool calls globally and per tool.
+
+    A call waits at most queue_timeout seconds for a slot and is then rejected
+    with a 429-style ToolError, so callers back off instead of queueing
+    without bound. While draining for shutdown new calls are rejected with a
+    503-style ToolError and in-flight ones are left to finish.
+    """
+
+    def __init__(self, max_concurrent: int, per_tool: Optional[Dict[str, int]] = None, queue_timeout: float = 1.0, retry_after: float = 1.0) -> None:
+        self._global = asyncio.Semaphore(max_concurrent)
+        self._per_tool = {name: asyncio.Semaphore(limit) for name, limit in (per_tool or {}).items()}
+        self._queue_timeout = queue_timeout
+        self._retry_after = retry_after
+        self.in_flight = 0
+        self.rejected = 0
+        self.draining = False
+
+    async def _acquire(self, semaphore: asyncio.Semaphore, tool: str) -> None:
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self._queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            logger.warning(f"Rejecting {tool}: no free slot after {self._queue_timeout}s")
+            raise ToolError(f"429 Too Many Requests: server busy, retry {tool} after {self._retry_after:g}s") from None
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next: CallNext) -> Any:
+        tool = context.message.name
+        if self.draining:
+            self.rejected += 1
+            raise ToolError(f"503 Service Unavailable: server is shutting down, retry {tool}")
+        tool_semaphore = self._per_tool.get(tool)
+        if tool_semaphore is not None:
+            await self._acquire(tool_semaphore, tool)
+        try:
+            await self._acquire(self._global, tool)
+            self.in_flight += 1
+            try:
+                return await call_next(context)
+            finally:
+                self.in_flight -= 1
+                self._global.release()
+        finally:
+            if tool_semaphore is not None:
+                tool_semaphore.release()
+
+
+class HttpBackpressure:
+    """ASGI middleware answering 429 once max_in_flight MCP POSTs are active.
+
+    Only POSTs are counted: streamable-http GET/SSE streams stay open for the
+    lifetime of a session and would otherwise exhaust the budget.
+    """
+
+    def __init__(self, app: ASGIApp, max_in_flight: int, retry_after: int = 1) -> None:
+        self.app = app
+        self._max_in_flight = max_in_flight
+        self._retry_after = retry_after
+        self._in_flight = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        if self._in_flight >= self._max_in_flight:
+            response = JSONResponse(
+                {"error": "too many requests"}, status_code=429, headers={"Retry-After": str(self._retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+        self._in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self._in_flight -= 1
+
+
+_tool_threads: Optional[anyio.CapacityLimiter] = None
+
+
+def set_tool_threads(count: int) -> None:
+    global _tool_threads
+    _tool_threads = anyio.CapacityLimiter(count)
+
+
+def offload(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Runs a blocking (gRPC) tool in a worker thread so the event loop keeps
+    serving other sessions while it waits on the backend."""
+
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        return await anyio.to_thread.run_sync(functools.partial(fn, *args, **kwargs), limiter=_tool_threads)
+
+    return wrapper
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from json.encoder import encode_basestring_ascii as _quote
+from typing import Any, Iterable, Iterator
+
+import demo_pb2
+
+# Each converter is a single dict literal over the message's fields: on the
+# upb backend every attribute read allocates, so nested messages are read
+# once and no field is touched twice.
+
+
+def money_to_dict(money: demo_pb2.Money) -> dict[str, Any]:
+    return {"currency_code": money.currency_code, "units": money.units, "nanos": money.nanos}
+
+
+def address_to_dict(address: demo_pb2.Address) -> dict[str, Any]:
+    return {
+        "street_address": address.street_address,
+        "city": address.city,
+        "state": address.state,
+        "country": address.country,
+        "zip_code": address.zip_code,
+    }
+
+
+def cart_item_to_dict(item: demo_pb2.CartItem) -> dict[str, Any]:
+    return {"product_id": item.product_id, "quantity": item.quantity}
+
+
+def product_to_dict(product: demo_pb2.Product, picture_prefix: str = "") -> dict[str, Any]:
+    price = product.price_usd
+    return {
+        "id": product.id,
+        "name": product.name,
+        "description": product.description,
+        "picture": picture_prefix + product.picture,
+        "price_usd": price.units,
+        "price_usd_nanos": price.nanos,
+        "categories": [*product.categories],
+    }
+
+
+def ad_to_dict(ad: demo_pb2.Ad, url_prefix: str = "") -> dict[str, Any]:
+    return {"redirect_url": url_prefix + ad.redirect_url, "text": ad.text}
+
+
+def order_result_to_dict(order: demo_pb2.OrderResult) -> dict[str, Any]:
+    return {
+        "order_id": order.order_id,
+        "shipping_tracking_id": order.shipping_tracking_id,
+        "shipping_cost": money_to_dict(order.shipping_cost),
+        "shipping_address": address_to_dict(order.shipping_address),
+        "items": [
+            {"item": cart_item_to_dict(item.item), "cost": money_to_dict(item.cost)}
+            for item in order.items
+        ],
+    }
+
+
+def product_to_json(product: demo_pb2.Product, picture_prefix: str = "") -> str:
+    """Same shape as product_to_dict, encoded straight from the protobuf."""
+    price = product.price_usd
+    return (
+        f'{{"id":{_quote(product.id)},"name":{_quote(product.name)},"description":{_quote(product.description)},'
+        f'"picture":{_quote(picture_prefix + product.picture)},"price_usd":{price.units},'
+        f'"price_usd_nanos":{price.nanos},"categories":[{",".join(map(_quote, product.categories))}]}}'
+    )
+
+
+def iter_products_json(
+    products: Iterable[demo_pb2.Product], picture_prefix: str = "", key: str = "results", chunk_size: int = 256
+) -> Iterator[bytes]:
+    """Yields a {"<key>": [...]} JSON document in chunks of chunk_size products."""
+    yield f'{{{_quote(key)}:['.encode()
+    batch: list[str] = []
+    separator = ""
+    for product in products:
+        batch.append(product_to_json(product, picture_prefix))
+        if len(batch) == chunk_size:
+            yield (separator + ",".join(batch)).encode()
+            batch.clear()
+            separator = ","
+    if batch:
+        yield (separator + ",".join(batch)).encode()
+    yield b"]}"
+
+
+def products_to_json_bytes(products: Iterable[demo_pb2.Product], picture_prefix: str = "", key: str = "results") -> bytes:
+    body = ",".join([product_to_json(product, picture_prefix) for product in products])
+    return f'{{{_quote(key)}:[{body}]}}'.encode()
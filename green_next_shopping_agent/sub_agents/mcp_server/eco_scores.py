@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from catalog_snapshot import CatalogView
+
+logger = logging.getLogger(__name__)
+
+
+class EcoScores:
+    """Eco scores (0-100, as rated by the greenness analyzer) per product id.
+
+    Loaded from a JSON object {"<product_id>": score} and exposed as a float32
+    column aligned with a CatalogView; products without a score are NaN. The
+    file is reloaded when it changes, so scores can be published at any time.
+    """
+
+    def __init__(self, path: Optional[Path]) -> None:
+        self._path = path
+        self._scores: Optional[Dict[str, float]] = None
+        self._mtime: Optional[float] = None
+        self._column: Optional[Tuple[CatalogView, np.ndarray]] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._scores or ())
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return self._path.stat().st_mtime if self._path is not None else None
+        except OSError:
+            return None
+
+    def _load(self) -> Dict[str, float]:
+        if self._mtime is None:
+            return {}
+        try:
+            return {str(k): float(v) for k, v in json.loads(self._path.read_text()).items()}
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning(f"Could not load eco scores from {self._path}: {e}")
+            return {}
+
+    def column(self, view: CatalogView) -> np.ndarray:
+        mtime = self._file_mtime()
+        with self._lock:
+            if mtime != self._mtime:
+                self._scores = None
+                self._column = None
+                self._mtime = mtime
+            if self._column is not None and self._column[0] is view:
+                return self._column[1]
+            if self._scores is None:
+                self._scores = self._load()
+                logger.info(f"Loaded {len(self._scores)} eco scores")
+            scores = self._scores
+            column = np.fromiter((scores.get(product_id, np.nan) for product_id in view.ids), dtype=np.float32, count=len(view))
+            self._column = (view, column)
+            return column
+
+    def reload(self) -> None:
+        with self._lock:
+            self._scores = None
+            self._mtime = None
+            self._column = None
@@ -1,50 +1,281 @@
 from __future__ import annotations
 
 import grpc
-from typing import Optional
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Hashable, Iterable, Optional, Tuple, TypeVar
 
 import demo_pb2, demo_pb2_grpc
+from channels import pool
 
+logger = logging.getLogger(__name__)
 
-class ProductCatalogClient:
+T = TypeVar("T")
+
+BREAKER_WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", "30"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "10"))
+BREAKER_TRIAL_SECONDS = float(os.getenv("BREAKER_TRIAL_SECONDS", "10"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "1.0"))
+
+# Status codes that say something about the backend, not about the request
+_BREAKER_FAILURE_CODES = frozenset({
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+})
+
+# grpc.health.v1.Health/Check with raw bytes: an empty HealthCheckRequest
+# checks the whole server, and SERVING is status field 1 = 1.
+_HEALTH_CHECK_METHOD = "/grpc.health.v1.Health/Check"
+_HEALTH_SERVING = b"\x08\x01"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, target: str, retry_after: float) -> None:
+        super().__init__(f"{target} is unavailable (circuit open), retry in {retry_after:.1f}s")
+        self.target = target
+        self.retry_after = retry_after
+
+
+def health_check(channel: grpc.Channel, timeout: float = HEALTH_CHECK_TIMEOUT) -> bool:
+    """True if the server answers the standard gRPC health check with SERVING.
+
+    Servers without the health service still prove they are reachable.
+    """
+    check = channel.unary_unary(_HEALTH_CHECK_METHOD)
+    try:
+        return check(b"", timeout=timeout) == _HEALTH_SERVING
+    except grpc.RpcError as e:
+        return e.code() == grpc.StatusCode.UNIMPLEMENTED
+
+
+class CircuitBreaker:
+    """Rolling error-rate circuit breaker for one backend target.
+
+    closed: calls pass, outcomes of the last window_seconds are tracked.
+    open: calls fail immediately with CircuitOpenError for open_seconds.
+    half-open: one caller runs a health check and, if it passes, a trial call
+    with a trial_seconds deadline; its outcome closes or re-opens the circuit.
+    Other callers are rejected. A trial that has not finished by its deadline
+    counts as failed, so a hung call cannot hold the circuit half-open.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(
+        self,
+        target: str,
+        window_seconds: float = BREAKER_WINDOW_SECONDS,
+        min_calls: int = BREAKER_MIN_CALLS,
+        failure_rate: float = BREAKER_FAILURE_RATE,
+        open_seconds: float = BREAKER_OPEN_SECONDS,
+        trial_seconds: float = BREAKER_TRIAL_SECONDS,
+        probe: Callable[[grpc.Channel], bool] = health_check,
+    ) -> None:
+        self.target = target
+        self.state = self.CLOSED
+        self._window_seconds = window_seconds
+        self._min_calls = min_calls
+        self._failure_rate = failure_rate
+        self._open_seconds = open_seconds
+        self._trial_seconds = trial_seconds
+        self._probe = probe
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._opened_at = 0.0
+        self._trial_started = 0.0
+        # Bumped per trial, so the outcome of an expired trial is ignored
+        self._trial = 0
+        self._lock = threading.Lock()
+
+    def _open(self, now: float) -> None:
+        if self.state != self.OPEN:
+            logger.warning(f"Circuit for {self.target} opened")
+        self.state = self.OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+
+    def _before_call(self, channel: grpc.Channel) -> Optional[int]:
+        """Returns the trial number if this call is the half-open trial, else None."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.CLOSED:
+                return None
+            if self.state == self.HALF_OPEN:
+                trial_deadline = self._trial_started + self._trial_seconds
+                if now < trial_deadline:
+                    raise CircuitOpenError(self.target, trial_deadline - now)
+                logger.warning(f"Trial call to {self.target} did not finish in {self._trial_seconds:g}s")
+                self._open(trial_deadline)
+            remaining = self._opened_at + self._open_seconds - now
+            if remaining > 0:
+                raise CircuitOpenError(self.target, remaining)
+            self.state = self.HALF_OPEN
+            self._trial_started = now
+            self._trial += 1
+            trial = self._trial
+
+        try:
+            healthy = self._probe(channel)
+        except Exception:
+            healthy = False
+        if not healthy:
+            with self._lock:
+                if self._trial == trial:
+                    self._open(time.monotonic())
+            raise CircuitOpenError(self.target, self._open_seconds)
+        return trial
+
+    def _record(self, ok: bool, trial: Optional[int]) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if trial is not None:
+                if trial != self._trial or self.state != self.HALF_OPEN:
+                    return
+                if ok:
+                    logger.info(f"Circuit for {self.target} closed")
+                    self.state = self.CLOSED
+                else:
+                    self._open(now)
+                return
+            if self.state != self.CLOSED:
+                return
+            self._outcomes.append((now, ok))
+            while self._outcomes and self._outcomes[0][0] < now - self._window_seconds:
+                self._outcomes.popleft()
+            failures = sum(1 for _, success in self._outcomes if not success)
+            if len(self._outcomes) >= self._min_calls and failures / len(self._outcomes) >= self._failure_rate:
+                self._open(now)
+
+    def call(self, channel: grpc.Channel, method: Callable[..., T], request: Any) -> T:
+        trial = self._before_call(channel)
+        try:
+            response = method(request) if trial is None else method(request, timeout=self._trial_seconds)
+        except grpc.RpcError as e:
+            self._record(e.code() not in _BREAKER_FAILURE_CODES, trial)
+            raise
+        except BaseException:
+            self._record(True, trial)
+            raise
+        self._record(True, trial)
+        return response
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(target: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(target)
+        if breaker is None:
+            breaker = _breakers[target] = CircuitBreaker(target)
+        return breaker
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution.
+
+    The first caller runs fn; callers arriving while it is in flight wait and
+    receive the same result (or exception). Results are shared, not copied,
+    so callers must treat them as read-only.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+# Shared by every ProductCatalogClient so identical catalog RPCs issued from
+# concurrent tool calls go to the backend once.
+_catalog_flights = SingleFlight()
+
+
+class _PooledClient:
+    def close(self) -> None:
+        # Channels belong to the pool (or to the caller that passed one in)
+        pass
+
+
+class ProductCatalogClient(_PooledClient):
     def __init__(self, target: str = "productcatalogservice:3550", channel: Optional[grpc.Channel] = None) -> None:
-        self._own_channel = channel is None
-        self._channel = channel or grpc.insecure_channel(target)
+        self._target = target
+        self._channel = channel or pool.get(target, "catalog")
         self._stub = demo_pb2_grpc.ProductCatalogServiceStub(self._channel)
+        self._breaker = breaker_for(target)
 
     def search_products(self, query: str) -> demo_pb2.SearchProductsResponse:
         request = demo_pb2.SearchProductsRequest(query=query)
-        return self._stub.SearchProducts(request)
+        return _catalog_flights.do(
+            (self._target, "SearchProducts", query), lambda: self._breaker.call(self._channel, self._stub.SearchProducts, request)
+        )
 
     def list_products(self) -> demo_pb2.ListProductsResponse:
         request = demo_pb2.Empty()
-        return self._stub.ListProducts(request)
-            
-    def close(self) -> None:
-        if self._own_channel:
-            self._channel.close()
+        return _catalog_flights.do(
+            (self._target, "ListProducts"), lambda: self._breaker.call(self._channel, self._stub.ListProducts, request)
+        )
 
 
-class CartClient:
+class CartClient(_PooledClient):
     def __init__(self, target: str = "cartservice:7070", channel: Optional[grpc.Channel] = None) -> None:
-        self._own_channel = channel is None
-        self._channel = channel or grpc.insecure_channel(target)
+        self._channel = channel or pool.get(target)
         self._stub = demo_pb2_grpc.CartServiceStub(self._channel)
+        self._breaker = breaker_for(target)
 
     def add_item(self, user_id: str, product_id: str, quantity: int = 1) -> demo_pb2.Empty:
         request = demo_pb2.AddItemRequest(user_id=user_id, item=demo_pb2.CartItem(product_id=product_id, quantity=quantity))
-        return self._stub.AddItem(request)
+        return self._breaker.call(self._channel, self._stub.AddItem, request)
 
-    def close(self) -> None:
-        if self._own_channel:
-            self._channel.close()
+    def get_cart(self, user_id: str) -> demo_pb2.Cart:
+        request = demo_pb2.GetCartRequest(user_id=user_id)
+        return self._breaker.call(self._channel, self._stub.GetCart, request)
+
+    def empty_cart(self, user_id: str) -> demo_pb2.Empty:
+        request = demo_pb2.EmptyCartRequest(user_id=user_id)
+        return self._breaker.call(self._channel, self._stub.EmptyCart, request)
 
 
-class CheckoutClient:
+class CheckoutClient(_PooledClient):
     def __init__(self, target: str = "checkoutservice:5050", channel: Optional[grpc.Channel] = None) -> None:
-        self._own_channel = channel is None
-        self._channel = channel or grpc.insecure_channel(target)
+        self._channel = channel or pool.get(target)
         self._stub = demo_pb2_grpc.CheckoutServiceStub(self._channel)
+        self._breaker = breaker_for(target)
 
     def place_order(
         self,
@@ -81,8 +312,29 @@ class CheckoutClient:
             email=email,
             credit_card=credit_card,
         )
-        return self._stub.PlaceOrder(request)
+        return self._breaker.call(self._channel, self._stub.PlaceOrder, request)
 
-    def close(self) -> None:
-        if self._own_channel:
-            self._channel.close()
+
+class ShippingClient(_PooledClient):
+    def __init__(self, target: str = "shippingservice:50051", channel: Optional[grpc.Channel] = None) -> None:
+        self._channel = channel or pool.get(target)
+        self._stub = demo_pb2_grpc.ShippingServiceStub(self._channel)
+        self._breaker = breaker_for(target)
+
+    def get_quote(self, street_address: str, city: str, state: str, country: str, zip_code: int, items: Iterable[Tuple[str, int]]) -> demo_pb2.GetQuoteResponse:
+        request = demo_pb2.GetQuoteRequest(
+            address=demo_pb2.Address(street_address=street_address, city=city, state=state, country=country, zip_code=zip_code),
+            items=[demo_pb2.CartItem(product_id=product_id, quantity=quantity) for product_id, quantity in items],
+        )
+        return self._breaker.call(self._channel, self._stub.GetQuote, request)
+
+
+class AdClient(_PooledClient):
+    def __init__(self, target: str = "adservice:9555", channel: Optional[grpc.Channel] = None) -> None:
+        self._channel = channel or pool.get(target)
+        self._stub = demo_pb2_grpc.AdServiceStub(self._channel)
+        self._breaker = breaker_for(target)
+
+    def get_ads(self, context_keys: Iterable[str]) -> demo_pb2.AdResponse:
+        request = demo_pb2.AdRequest(context_keys=list(context_keys))
+        return self._breaker.call(self._channel, self._stub.GetAds, request)
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from grpc_clients import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+def derive_key(tool: str, args: Dict[str, Any]) -> str:
+    payload = json.dumps([tool, args], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """Results of side-effecting tool calls, replayed for duplicate requests.
+
+    Calls carrying an explicit idempotency key are remembered per user for
+    ttl_seconds, with a hash of their arguments: reusing the key for
+    different arguments is an error, not a replay. Calls without a key run
+    every time, unless window_seconds > 0 dedupes identical arguments for
+    that long. Concurrent duplicates wait for the first call.
+    Only successful results are stored, so a failed call can be retried.
+
+    Entries live in a bounded in-memory LRU in front of an optional sqlite
+    table, which survives restarts and is shared by worker processes.
+    """
+
+    def __init__(self, path: Optional[Path], max_entries: int = 10000, ttl_seconds: float = 86400.0, window_seconds: float = 0.0) -> None:
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._window_seconds = window_seconds
+        self._memory: "OrderedDict[str, Tuple[float, str, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+        self._db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, expires REAL NOT NULL, result TEXT NOT NULL, args_hash TEXT NOT NULL DEFAULT '')"
+                )
+                if "args_hash" not in {row[1] for row in self._db.execute("PRAGMA table_info(results)")}:
+                    self._db.execute("ALTER TABLE results ADD COLUMN args_hash TEXT NOT NULL DEFAULT ''")
+                self._db.execute("DELETE FROM results WHERE expires < ?", (time.time(),))
+            except sqlite3.Error as e:
+                logger.warning(f"Idempotency table at {path} unavailable, keeping results in memory only: {e}")
+                self._db = None
+
+    def _lookup(self, key: str) -> Optional[Tuple[str, dict]]:
+        """(args_hash, result) stored for the key, if it has not expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] >= now:
+                    self._memory.move_to_end(key)
+                    return entry[1], entry[2]
+                del self._memory[key]
+            if self._db is None:
+                return None
+            row = self._db.execute("SELECT expires, args_hash, result FROM results WHERE key = ? AND expires >= ?", (key, now)).fetchone()
+        if row is None:
+            return None
+        result = json.loads(row[2])
+        self._remember(key, row[0], row[1], result, persist=False)
+        return row[1], result
+
+    def _remember(self, key: str, expires: float, args_hash: str, result: dict, persist: bool = True) -> None:
+        with self._lock:
+            self._memory[key] = (expires, args_hash, result)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self._max_entries:
+                self._memory.popitem(last=False)
+            if persist and self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO results (key, expires, args_hash, result) VALUES (?, ?, ?, ?)",
+                        (key, expires, args_hash, json.dumps(result)),
+                    )
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not persist idempotency result: {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def run(self, tool: str, user_id: str, idempotency_key: str, args: Dict[str, Any], fn: Callable[[], dict]) -> dict:
+        args_hash = derive_key(tool, args)
+        if idempotency_key:
+            # Keys are chosen by clients, so two users may well both send "order-1"
+            key, ttl = f"{tool}:{user_id}:{idempotency_key}", self._ttl_seconds
+        elif self._window_seconds > 0:
+            key, ttl = f"{tool}:args:{args_hash}", self._window_seconds
+        else:
+            return fn()
+
+        executed = False
+
+        def execute() -> Tuple[str, dict]:
+            nonlocal executed
+            cached = self._lookup(key)
+            if cached is not None:
+                return cached
+            executed = True
+            result = fn()
+            self._remember(key, time.time() + ttl, args_hash, result)
+            return args_hash, result
+
+        # Followers of a concurrent duplicate share the leader's result
+        stored_hash, result = self._flights.do(key, execute)
+        if executed:
+            return result
+        if stored_hash and stored_hash != args_hash:
+            raise ValueError(f"idempotency_key {idempotency_key!r} was already used for a different {tool} request; use a new key")
+        logger.info(f"Replaying {tool} result for duplicate request")
+        return {**result, "idempotent_replay": True}
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import io
+import logging
+import os
+from pathlib import Path
+from typing import Callable, Collection, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+import requests
+from PIL import Image
+
+from vector_index import PersistentIndex, VectorIndex
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "product_images"
+_THUMB = 16
+_HSV_BINS = (8, 3, 3)
+
+
+def embed_image(data: bytes) -> np.ndarray:
+    """CPU image descriptor: HSV colour histogram + grayscale layout thumbnail.
+
+    Both blocks are L2-normalized separately so colour and shape weigh the
+    same in the cosine similarity.
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        rgb = img.convert("RGB")
+        rgb.thumbnail((128, 128))
+        hsv = np.asarray(rgb.convert("HSV"), dtype=np.uint16).reshape(-1, 3)
+        gray = np.asarray(rgb.convert("L").resize((_THUMB, _THUMB)), dtype=np.float32).ravel()
+
+    h, s, v = (hsv[:, i] * n // 256 for i, n in enumerate(_HSV_BINS))
+    bins = (h * _HSV_BINS[1] + s) * _HSV_BINS[2] + v
+    color = np.bincount(bins, minlength=int(np.prod(_HSV_BINS))).astype(np.float32)
+    layout = gray - gray.mean()
+
+    blocks = []
+    for block in (np.sqrt(color), layout):
+        norm = np.linalg.norm(block)
+        blocks.append(block / norm if norm else block)
+    return np.concatenate(blocks)
+
+
+def build_image_index(pictures: Iterable[Tuple[str, str]], fetch: Callable[[str], bytes]) -> VectorIndex:
+    """Embeds every (product_id, picture_url); unreadable pictures are skipped."""
+    ids, vectors = [], []
+    for product_id, url in pictures:
+        try:
+            vectors.append(embed_image(fetch(url)))
+            ids.append(product_id)
+        except Exception as e:
+            logger.warning(f"Skipping picture for {product_id} ({url}): {e}")
+    if not vectors:
+        return VectorIndex([], np.zeros((0, 0), dtype=np.float32))
+    return VectorIndex.from_vectors(ids, np.stack(vectors))
+
+
+def fetch_url(url: str, timeout: float = 10.0, allow_redirects: bool = True) -> bytes:
+    response = requests.get(url, timeout=timeout, allow_redirects=allow_redirects)
+    response.raise_for_status()
+    return response.content
+
+
+def check_image_url(url: str, allowed_hosts: Collection[str]) -> str:
+    """Rejects user-supplied URLs outside http(s) and the allowed hosts, so the
+    server cannot be used to reach internal addresses."""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("image_url must be an http(s) URL")
+    if parts.hostname.lower() not in allowed_hosts:
+        raise ValueError(f"image_url host {parts.hostname!r} is not allowed, pass the photo as image_base64 instead")
+    return url
+
+
+class ImageIndex(PersistentIndex):
+    """Product picture embeddings, rebuilt from the catalog when it changes."""
+
+    def __init__(
+        self,
+        directory: Path,
+        pictures: Callable[[], Iterable[Tuple[str, str]]],
+        version: Optional[Callable[[], Optional[str]]] = None,
+        min_similarity: float = 0.0,
+    ) -> None:
+        super().__init__(directory, INDEX_NAME, version)
+        self._pictures = pictures
+        self._min_similarity = min_similarity
+
+    def build(self) -> VectorIndex:
+        return build_image_index(self._pictures(), fetch_url)
+
+    def search(self, image: bytes, k: int) -> list[Tuple[str, float]]:
+        # top_k always fills k slots; anything below the threshold is not a look-alike
+        return [(product_id, score) for product_id, score in self.get().top_k(embed_image(image), k) if score >= self._min_similarity]
+
+
+if __name__ == "__main__":
+    # Prebuild the index, e.g. as an init step: python3 image_index.py
+    import mcp_server
+
+    logging.basicConfig(level=logging.INFO)
+    built = mcp_server.image_index.rebuild()
+    print(f"Indexed {len(built)} product pictures into {os.getenv('INDEX_DIR', mcp_server.INDEX_DIR)}")
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import logging
+import os
+import signal
+import threading
+import time
+from types import FrameType
+from typing import Callable, List, Optional, Tuple
+
+import uvicorn
+
+from concurrency import ToolConcurrencyLimiter
+
+logger = logging.getLogger(__name__)
+
+STREAM_FLUSH_SECONDS = 0.5
+
+_hooks: List[Tuple[str, Callable[[], None]]] = []
+_shutdown_lock = threading.Lock()
+_shut_down = False
+
+
+def on_shutdown(name: str, hook: Callable[[], None]) -> None:
+    """Registers a hook run once at shutdown, in registration order."""
+    _hooks.append((name, hook))
+
+
+def shutdown() -> None:
+    global _shut_down
+    with _shutdown_lock:
+        if _shut_down:
+            return
+        _shut_down = True
+    for name, hook in _hooks:
+        try:
+            hook()
+        except Exception as e:
+            logger.warning(f"Shutdown hook {name} failed: {e}")
+    logger.info("Shutdown complete")
+
+
+def drain(limiter: ToolConcurrencyLimiter, deadline_seconds: float) -> bool:
+    """Rejects new tool calls and waits for in-flight ones, up to the deadline.
+
+    Returns True if every in-flight call finished in time.
+    """
+    limiter.draining = True
+    deadline = time.monotonic() + deadline_seconds
+    while limiter.in_flight and time.monotonic() < deadline:
+        time.sleep(0.05)
+    if limiter.in_flight:
+        logger.warning(f"Drain deadline reached with {limiter.in_flight} tool calls in flight")
+        return False
+    logger.info("Drained all in-flight tool calls")
+    return True
+
+
+def install_sigterm_handler(limiter: ToolConcurrencyLimiter, deadline_seconds: float) -> None:
+    """On SIGTERM: drain, run the shutdown hooks, then terminate.
+
+    For servers whose run loop has no signal handling of its own (stdio).
+    The drain runs in a thread so the event loop keeps finishing the
+    in-flight calls meanwhile.
+    """
+
+    def terminate() -> None:
+        drain(limiter, deadline_seconds)
+        shutdown()
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    def handle(signum, frame) -> None:
+        logger.info("SIGTERM received, draining")
+        # A second SIGTERM (and the one sent once drained) terminates at once
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        threading.Thread(target=terminate, name="drain", daemon=True).start()
+
+    signal.signal(signal.SIGTERM, handle)
+
+
+_drain_target: Optional[Tuple[ToolConcurrencyLimiter, float]] = None
+
+
+def hold_streams_until_drained(limiter: ToolConcurrencyLimiter, deadline_seconds: float) -> None:
+    """Keeps SSE streams open on SIGTERM until in-flight tool calls finish.
+
+    sse-starlette ends every stream as soon as uvicorn sees the signal, which
+    drops the results of calls still running. Under DrainingServer the
+    streams are released only after the drain; otherwise they are released
+    when the app's lifespan ends.
+    """
+    global _drain_target
+    _drain_target = (limiter, deadline_seconds)
+    from sse_starlette.sse import AppStatus
+
+    # sse-starlette >= 3.2; older versions are bypassed in DrainingServer.handle_exit
+    disable = getattr(AppStatus, "disable_automatic_graceful_drain", None)
+    if disable is not None:
+        disable()
+
+
+def release_streams() -> None:
+    from sse_starlette.sse import AppStatus
+
+    AppStatus.should_exit = True
+
+
+def _drain_then_release(limiter: ToolConcurrencyLimiter, deadline_seconds: float) -> None:
+    drain(limiter, deadline_seconds)
+    # Let the last results reach their streams before they close
+    time.sleep(STREAM_FLUSH_SECONDS)
+    release_streams()
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn server that starts the tool-call drain as soon as it is signalled.
+
+    uvicorn's graceful shutdown then waits for the held streams, which close
+    once the in-flight calls have sent their results.
+    """
+
+    def handle_exit(self, sig: int, frame: Optional[FrameType]) -> None:
+        if _drain_target is None:
+            super().handle_exit(sig, frame)
+            return
+        limiter, deadline_seconds = _drain_target
+        if not limiter.draining:
+            limiter.draining = True
+            threading.Thread(target=_drain_then_release, args=(limiter, deadline_seconds), name="drain", daemon=True).start()
+        from sse_starlette.sse import AppStatus
+
+        original = getattr(AppStatus, "original_handler", None)
+        if not hasattr(AppStatus, "disable_automatic_graceful_drain") and original is not None:
+            # Older sse-starlette wraps Server.handle_exit to end all streams and has no opt-out
+            original(self, sig, frame)
+        else:
+            super().handle_exit(sig, frame)
@@ -1,9 +1,26 @@
 from __future__ import annotations
 
+import argparse
+import base64
 import logging
 import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from pathlib import Path
 from typing import Any
-from fastmcp import FastMCP
+from urllib.parse import urlsplit
+import anyio
+import grpc
+import numpy as np
+import uvicorn
+from fastmcp import FastMCP, Context
+from starlette.middleware import Middleware as StarletteMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
 
 logger = logging.getLogger(__name__)
 
@@ -11,117 +28,541 @@ from grpc_clients import (
     ProductCatalogClient,
     CartClient,
     CheckoutClient,
+    ShippingClient,
+    AdClient,
+    CircuitOpenError,
+    health_check,
 )
+from channels import pool
+from catalog_snapshot import NANOS, CatalogSnapshot
+from eco_scores import EcoScores
+from converters import ad_to_dict, money_to_dict, product_to_dict, order_result_to_dict
+from sessions import SessionStore
+from snapshots import SnapshotStore
+from idempotency import IdempotencyStore
+from image_index import ImageIndex, check_image_url, fetch_url
+from text_search import SemanticSearch, product_document
+from ttl_cache import TTLCache
+from concurrency import HttpBackpressure, ToolConcurrencyLimiter, offload, parse_limits, set_tool_threads
+import lifecycle
 
 # Service endpoints - use environment variables for containerized deployment
 PRODUCT_CATALOG_SERVICE = os.getenv("PRODUCT_CATALOG_SERVICE", "productcatalogservice:3550")
 CART_SERVICE = os.getenv("CART_SERVICE", "cartservice:7070") 
 CHECKOUT_SERVICE = os.getenv("CHECKOUT_SERVICE", "checkoutservice:5050")
+SHIPPING_SERVICE = os.getenv("SHIPPING_SERVICE", "shippingservice:50051")
+AD_SERVICE = os.getenv("AD_SERVICE", "adservice:9555")
+AD_CACHE_TTL = float(os.getenv("AD_CACHE_TTL", "300"))
+SHIPPING_QUOTE_TTL = float(os.getenv("SHIPPING_QUOTE_TTL", "3600"))
+CATALOG_SNAPSHOT_TTL = float(os.getenv("CATALOG_SNAPSHOT_TTL", "300"))
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "50"))
+# Upper bound for a model-chosen page_size, so one page stays within the memory and token budget
+LIST_PAGE_SIZE_MAX = int(os.getenv("LIST_PAGE_SIZE_MAX", str(LIST_PAGE_SIZE * 4)))
+CART_CACHE_TTL = float(os.getenv("CART_CACHE_TTL", "600"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "50000"))
+SESSION_MAX_MB = int(os.getenv("SESSION_MAX_MB", "64"))
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "86400"))
+INDEX_DIR = Path(os.getenv("INDEX_DIR", "/tmp/green-next-index"))
+ECO_SCORES_PATH = Path(os.getenv("ECO_SCORES_PATH", str(INDEX_DIR / "eco_scores.json")))
+# Cosine similarity below which a picture does not count as a match for search_by_image.
+# Product photos share white backgrounds, so unrelated ones already score ~0.6-0.7.
+IMAGE_MIN_SIMILARITY = float(os.getenv("IMAGE_MIN_SIMILARITY", "0.75"))
+# Hosts search_by_image may fetch an image_url from (default: the catalog picture host)
+IMAGE_URL_HOSTS = os.getenv("IMAGE_URL_HOSTS", "")
+# Dedup of add_item/place_order retries; an empty IDEMPOTENCY_DB keeps results in memory only
+IDEMPOTENCY_DB = os.getenv("IDEMPOTENCY_DB", "/tmp/green-next-idempotency.sqlite3")
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+# Seconds to also dedupe identical calls without a key; 0 runs every key-less call
+IDEMPOTENCY_WINDOW = float(os.getenv("IDEMPOTENCY_WINDOW", "0"))
+# Catalog and cache snapshots restored on startup; an empty SNAPSHOT_DIR disables them
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", str(INDEX_DIR / "snapshots"))
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "300"))
+
+# Server mode and concurrency controls
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio")
+MCP_HOST = os.getenv("MCP_HOST", "0.0.0.0")
+MCP_PORT = int(os.getenv("MCP_PORT", "8000"))
+MCP_PATH = os.getenv("MCP_PATH", "/mcp")
+MCP_WORKERS = int(os.getenv("MCP_WORKERS", "1"))
+MCP_TOOL_THREADS = int(os.getenv("MCP_TOOL_THREADS", "16"))
+MCP_MAX_CONCURRENT_TOOLS = int(os.getenv("MCP_MAX_CONCURRENT_TOOLS", "32"))
+MCP_TOOL_CONCURRENCY = os.getenv("MCP_TOOL_CONCURRENCY", "place_order=8,list_products=4")
+MCP_QUEUE_TIMEOUT = float(os.getenv("MCP_QUEUE_TIMEOUT", "1.0"))
+MCP_MAX_INFLIGHT_REQUESTS = int(os.getenv("MCP_MAX_INFLIGHT_REQUESTS", "64"))
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "5"))
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+# How long in-flight tool calls get to finish on SIGTERM; keep below the pod's terminationGracePeriodSeconds
+MCP_DRAIN_SECONDS = float(os.getenv("MCP_DRAIN_SECONDS", "20"))
 
 # Debug: Log the actual values being used
 logger.info(f"PRODUCT_CATALOG_SERVICE: {PRODUCT_CATALOG_SERVICE}")
 logger.info(f"CART_SERVICE: {CART_SERVICE}")
 logger.info(f"CHECKOUT_SERVICE: {CHECKOUT_SERVICE}")
+logger.info(f"SHIPPING_SERVICE: {SHIPPING_SERVICE}")
+logger.info(f"AD_SERVICE: {AD_SERVICE}")
 
 # Create server
 mcp = FastMCP("FastMCP Server for Green Next Shopping")
+tool_limiter = ToolConcurrencyLimiter(MCP_MAX_CONCURRENT_TOOLS, parse_limits(MCP_TOOL_CONCURRENCY), queue_timeout=MCP_QUEUE_TIMEOUT)
+mcp.add_middleware(tool_limiter)
+set_tool_threads(MCP_TOOL_THREADS)
 ip_address = os.getenv("IP_ADDRESS", "http://35.185.109.77/")
+picture_prefix = ip_address or ""
+image_url_hosts = frozenset(h.strip().lower() for h in IMAGE_URL_HOSTS.split(",") if h.strip()) or frozenset(
+    filter(None, [urlsplit(picture_prefix).hostname])
+)
+catalog = CatalogSnapshot(lambda: ProductCatalogClient(target=PRODUCT_CATALOG_SERVICE), ttl_seconds=CATALOG_SNAPSHOT_TTL)
+sessions = SessionStore(
+    max_sessions=SESSION_MAX, max_bytes=SESSION_MAX_MB * 1024 * 1024, idle_seconds=SESSION_IDLE_SECONDS, cart_ttl_seconds=CART_CACHE_TTL
+)
+idempotency = IdempotencyStore(
+    Path(IDEMPOTENCY_DB) if IDEMPOTENCY_DB else None, ttl_seconds=IDEMPOTENCY_TTL, window_seconds=IDEMPOTENCY_WINDOW
+)
+
+
+def picture_urls():
+    view = catalog.get()
+    return zip(view.ids, (picture_prefix + picture for picture in view.pictures))
+
+
+def product_documents():
+    view = catalog.get()
+    for row, (product_id, name, description) in enumerate(zip(view.ids, view.names, view.descriptions)):
+        yield product_id, product_document(name, description, view.row_categories(row))
+
+
+eco_scores = EcoScores(ECO_SCORES_PATH)
+ads_cache = TTLCache(max_entries=4096, ttl_seconds=AD_CACHE_TTL)
+shipping_quotes = TTLCache(max_entries=10000, ttl_seconds=SHIPPING_QUOTE_TTL)
+snapshots = SnapshotStore(Path(SNAPSHOT_DIR), catalog, interval_seconds=SNAPSHOT_INTERVAL) if SNAPSHOT_DIR else None
+if snapshots is not None:
+    snapshots.add_cache("ads", ads_cache, key_type=frozenset)
+    snapshots.add_cache("shipping_quotes", shipping_quotes)
+# Warms caches off the response path (ads for shown products, ...)
+prefetcher = ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+image_index = ImageIndex(INDEX_DIR, picture_urls, version=lambda: catalog.get().version, min_similarity=IMAGE_MIN_SIMILARITY)
+text_index = SemanticSearch(INDEX_DIR, product_documents, version=lambda: catalog.get().version)
+
+
+def prefetch(what: str, fn, *args) -> None:
+    def run() -> None:
+        try:
+            fn(*args)
+        except Exception as e:
+            logger.warning(f"Prefetching {what} failed: {e}")
+
+    prefetcher.submit(run)
+
+
+def ad_context(categories) -> frozenset[str]:
+    return frozenset(c.strip().lower() for c in categories if c and c.strip())
+
+
+def load_ads(context: frozenset[str]) -> list[dict[str, Any]]:
+    client = AdClient(target=AD_SERVICE)
+    try:
+        return [ad_to_dict(ad, picture_prefix) for ad in client.get_ads(sorted(context)).ads]
+    finally:
+        client.close()
+
+
+def ads_for(context: frozenset[str]) -> list[dict[str, Any]]:
+    return ads_cache.get_or_load(context, lambda: load_ads(context))
+
+
+def prefetch_ads(results: list[dict[str, Any]]) -> None:
+    # get_ads is usually called next with the categories of these products
+    if results:
+        prefetch("ads", ads_for, ad_context(c for r in results for c in r["categories"]))
+
+
+def catalog_version() -> str | None:
+    # Lets agent-side caches tell when the catalog changed; never loads it
+    current = catalog.peek()
+    return current[0].version if current else None
+
+
+def ranked(user_id: str, results: list[dict[str, Any]]) -> dict[str, Any]:
+    # Remember the result order so add_item can take "item 2" as rank=2
+    if user_id:
+        sessions.remember_results(user_id, [r["id"] for r in results])
+        for rank, result in enumerate(results, 1):
+            result["rank"] = rank
+    return {"results": results, "catalog_version": catalog_version()}
+
+
 @mcp.tool()
-def search_products(product_name: str) -> dict[str, Any]:
+@offload
+def search_products(product_name: str, user_id: str = "") -> dict[str, Any]:
     logger.info(f"search_products called with target: {PRODUCT_CATALOG_SERVICE}")
     client = ProductCatalogClient(target=PRODUCT_CATALOG_SERVICE)
     try:
         resp = client.search_products(product_name)
-        
-        return {
-            "results": [
-            {
-                "id": p.id, 
-                "name": p.name, 
-                "description": p.description, 
-                "picture": (f"{ip_address}{p.picture}" if ip_address else p.picture),
-                "price_usd": p.price_usd.units,
-                "price_usd_nanos": p.price_usd.nanos,
-                "categories": list(p.categories)
-            } 
-            for p in resp.results]}
-    finally:    
+        results = [product_to_dict(p, picture_prefix) for p in resp.results]
+        prefetch_ads(results)
+        return ranked(user_id, results)
+    finally:
         client.close()
 
 @mcp.tool()
+async def semantic_search_products(query: str, top_k: int = 10, user_id: str = "") -> dict[str, Any]:
+    """Search products by meaning rather than exact words, e.g. "eco water bottle" also finds "reusable flask"."""
+    matches = await anyio.to_thread.run_sync(text_index.search, query, top_k)
+    view = await anyio.to_thread.run_sync(catalog.get)
+    results = []
+    for product_id, score in matches:
+        product = view.get(product_id, picture_prefix)
+        if product is not None:
+            results.append({**product, "similarity": round(score, 4)})
+    prefetch_ads(results)
+    return ranked(user_id, results)
+
+@mcp.tool()
+@offload
 def list_products() -> dict[str, Any]:
-    client = ProductCatalogClient(target=PRODUCT_CATALOG_SERVICE)
+    view = catalog.get()
+    return {"results": view.to_dicts(range(len(view)), picture_prefix), "catalog_version": view.version}
+
+PRICE_BUCKETS = (10, 25, 50, 100)
+SORT_ORDERS = ("", "price_asc", "price_desc", "eco_score", "name")
+
+
+@mcp.tool()
+@offload
+def filter_products(
+    categories: list[str] | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    min_eco_score: float | None = None,
+    sort_by: str = "",
+    limit: int = 10,
+    user_id: str = "",
+) -> dict[str, Any]:
+    """Filter the catalog by categories (any of) and USD price range.
+
+    sort_by is one of "price_asc", "price_desc", "eco_score" (highest first) or "name".
+    Returns at most limit products, the total number of matches and facet counts
+    (per category and price range) to suggest refinements. min_eco_score (0-100)
+    and eco_score sorting only apply when eco_scores_available is true.
+    """
+    if sort_by not in SORT_ORDERS:
+        raise ValueError(f"sort_by must be one of {', '.join(o for o in SORT_ORDERS if o)}")
+    view = catalog.get()
+    eco = eco_scores.column(view)
+    # Without any scores the eco filter would drop every product, so it is ignored
+    eco_available = len(eco_scores) > 0
+    rows = view.filter((), min_price, max_price)
+    if min_eco_score is not None and eco_available:
+        # Products without an eco score never pass a threshold (NaN >= x is False)
+        rows = rows[eco[rows] >= min_eco_score]
+
+    # Category facets ignore the category filter so the other options stay visible
+    category_facets = view.category_counts(rows)
+    if categories:
+        rows = rows[view.category_mask(categories)[rows]]
+    buckets = np.bincount(np.searchsorted(np.asarray(PRICE_BUCKETS) * NANOS, view.price_nanos[rows], side="right"), minlength=len(PRICE_BUCKETS) + 1)
+    labels = [f"under {PRICE_BUCKETS[0]}"] + [f"{lo}-{hi}" for lo, hi in zip(PRICE_BUCKETS, PRICE_BUCKETS[1:])] + [f"{PRICE_BUCKETS[-1]}+"]
+
+    if sort_by == "price_asc":
+        rows = rows[np.argsort(view.price_nanos[rows], kind="stable")]
+    elif sort_by == "price_desc":
+        rows = rows[np.argsort(-view.price_nanos[rows], kind="stable")]
+    elif sort_by == "eco_score" and eco_available:
+        rows = rows[np.argsort(-np.nan_to_num(eco[rows], nan=-1.0), kind="stable")]
+    elif sort_by == "name":
+        rows = rows[np.argsort(np.asarray(view.names.take(rows), dtype=object), kind="stable")]
+
+    top = rows[:max(limit, 0)]
+    results = view.to_dicts(top, picture_prefix)
+    prefetch_ads(results)
+    for result, score in zip(results, eco[top].tolist()):
+        result["eco_score"] = None if score != score else round(score, 1)
+    return {
+        **ranked(user_id, results),
+        "total": len(rows),
+        "facets": {"categories": category_facets, "price_usd": dict(zip(labels, buckets.tolist()))},
+        "eco_scores_available": eco_available,
+    }
+
+@mcp.tool()
+async def list_products_page(cursor: int = 0, page_size: int = LIST_PAGE_SIZE, category: str = "", ctx: Context | None = None) -> dict[str, Any]:
+    """List one page of the catalog grouped by product category.
+
+    Start with cursor 0 and keep calling with next_cursor until it is null.
+    Optionally restrict the listing to a single category. page_size is capped
+    at LIST_PAGE_SIZE_MAX products.
+    """
+    view = await anyio.to_thread.run_sync(catalog.get)
+    positions = view.positions(category)
+    total = len(positions)
+    start = max(cursor, 0)
+    end = min(start + min(max(page_size, 1), LIST_PAGE_SIZE_MAX), total)
+
+    groups = []
+    delivered = start
+    for name, rows in view.chunks(positions[start:end]):
+        groups.append({"category": name, "products": view.to_dicts(rows, picture_prefix)})
+        delivered += len(rows)
+        if ctx is not None:
+            await ctx.report_progress(progress=delivered, total=total, message=f"{name}: {len(rows)} products")
+
+    return {
+        "categories": groups,
+        "next_cursor": end if end < total else None,
+        "total": total,
+        "catalog_version": view.version,
+    }
+
+@mcp.tool()
+async def search_by_image(image_base64: str = "", image_url: str = "", top_k: int = 5, user_id: str = "") -> dict[str, Any]:
+    """Find the catalog products that look most like a photo.
+
+    Pass the photo either as base64 data (image_base64) or as a URL (image_url)
+    on an allowed host. Returns no results when nothing in the catalog looks alike.
+    """
+    if image_base64:
+        data = base64.b64decode(image_base64.split(",", 1)[-1] if image_base64.startswith("data:") else image_base64)
+    elif image_url:
+        data = await anyio.to_thread.run_sync(partial(fetch_url, check_image_url(image_url, image_url_hosts), allow_redirects=False))
+    else:
+        raise ValueError("Provide image_base64 or image_url")
+
+    matches = await anyio.to_thread.run_sync(image_index.search, data, top_k)
+    view = await anyio.to_thread.run_sync(catalog.get)
+    results = []
+    for product_id, score in matches:
+        product = view.get(product_id, picture_prefix)
+        if product is not None:
+            results.append({**product, "similarity": round(score, 4)})
+    return ranked(user_id, results)
+
+@mcp.tool()
+@offload
+def get_ads(categories: list[str]) -> dict[str, Any]:
+    """Sponsored products for the categories of the products being shown."""
     try:
-        resp = client.list_products()
-        return {
-            "results": [
-            {
-                "id": p.id, 
-                "name": p.name, 
-                "description": p.description, 
-                "picture": (f"{ip_address}{p.picture}" if ip_address else p.picture),
-                "price_usd": p.price_usd.units,
-                "price_usd_nanos": p.price_usd.nanos,
-                "categories": list(p.categories)
-            } 
-            for p in resp.products]}
-    finally:
-        client.close()
+        ads = ads_for(ad_context(categories))
+    except (grpc.RpcError, CircuitOpenError) as e:
+        # Ads are optional; never fail the conversation over them
+        logger.warning(f"Ads unavailable: {e}")
+        ads = []
+    return {"ads": ads}
 
 @mcp.tool()
-def add_item(user_id: str, product_id: str, quantity: int) -> dict:
+@offload
+def add_item(user_id: str, product_id: str = "", quantity: int = 1, idempotency_key: str = "", rank: int = 0) -> dict:
+    """Add a product to the user's cart, by product_id or by its rank in the user's last search results.
+
+    Retrying with the same idempotency_key returns the first result instead of adding again;
+    reusing a key for a different item is an error.
+    """
+    if not product_id:
+        product_id = sessions.result_at(user_id, rank) or ""
+        if not product_id:
+            raise ValueError(f"No product at rank {rank} of the last search for {user_id}; pass product_id instead")
+
+    def call() -> dict:
+        client = CartClient(target=CART_SERVICE)
+        try:
+            _ = client.add_item(user_id,product_id,quantity)
+            logger.info(f"Add item response: {_}")
+            sessions.add_to_cart(user_id, product_id, quantity)
+            return {"status": "OK"}
+        finally:
+            client.close()
+
+    args = {"user_id": user_id, "product_id": product_id, "quantity": quantity}
+    return idempotency.run("add_item", user_id, idempotency_key, args, call)
+
+def load_cart(user_id: str) -> tuple[dict[str, int], bool]:
+    """The user's cart as product_id -> quantity, and whether it came from the session."""
+    items = sessions.get_cart(user_id)
+    if items is not None:
+        return items, True
     client = CartClient(target=CART_SERVICE)
     try:
-        _ = client.add_item(user_id,product_id,quantity)
-        logger.info(f"Add item response: {_}")
-        return {"status": "OK"}
+        cart = client.get_cart(user_id)
     finally:
         client.close()
+    items = {}
+    for item in cart.items:
+        items[item.product_id] = items.get(item.product_id, 0) + item.quantity
+    sessions.put_cart(user_id, items)
+    return items, False
+
+@mcp.tool()
+@offload
+def get_cart(user_id: str) -> dict[str, Any]:
+    """Show the user's cart with product names and prices."""
+    items, cached = load_cart(user_id)
+    view = catalog.get()
+    result = []
+    for product_id, quantity in items.items():
+        entry = {"product_id": product_id, "quantity": quantity}
+        product = view.get(product_id)
+        if product is not None:
+            entry.update(name=product["name"], price_usd=product["price_usd"], price_usd_nanos=product["price_usd_nanos"])
+        result.append(entry)
+    return {"user_id": user_id, "items": result, "currency": sessions.currency(user_id), "cached": cached}
 
 @mcp.tool()
-def place_order(user_id: str, user_currency: str, street_address: str, city: str, state: str, country: str, zip_code: int, email: str, credit_card_number: str, credit_card_cvv: int, credit_card_expiration_year: int, credit_card_expiration_month: int) -> dict:
-    client = CheckoutClient(target=CHECKOUT_SERVICE)
+@offload
+def empty_cart(user_id: str) -> dict:
+    client = CartClient(target=CART_SERVICE)
     try:
-        resp = client.place_order(
-            user_id, user_currency, street_address, city, state, country, zip_code, email, credit_card_number, credit_card_cvv, credit_card_expiration_year, credit_card_expiration_month
-        )
-        result = {
-            "order": {
-                "order_id": resp.order.order_id,
-                "shipping_tracking_id": resp.order.shipping_tracking_id,
-                "shipping_cost": {
-                    "currency_code": resp.order.shipping_cost.currency_code,
-                    "units": resp.order.shipping_cost.units,
-                    "nanos": resp.order.shipping_cost.nanos
-                },
-                "shipping_address": {
-                    "street_address": resp.order.shipping_address.street_address,
-                    "city": resp.order.shipping_address.city,
-                    "state": resp.order.shipping_address.state,
-                    "country": resp.order.shipping_address.country,
-                    "zip_code": resp.order.shipping_address.zip_code
-                },
-                "items": [
-                    {
-                        "item": {
-                            "product_id": item.item.product_id,
-                            "quantity": item.item.quantity
-                        },
-                        "cost": {
-                            "currency_code": item.cost.currency_code,
-                            "units": item.cost.units,
-                            "nanos": item.cost.nanos
-                        }
-                    }
-                    for item in resp.order.items
-                ]
-            }
-        }
-        logger.info(f"Place order response")
-        return result
+        client.empty_cart(user_id)
+        sessions.put_cart(user_id, {})
+        return {"status": "OK"}
     finally:
         client.close()
 
+# Upper bounds of the item-count buckets shipping quotes are shared across
+SHIPPING_ITEM_BUCKETS = (1, 2, 5, 10, 20)
+
+
+def shipping_quote_key(country: str, state: str, zip_code: int, item_count: int) -> tuple:
+    bucket = next((b for b in SHIPPING_ITEM_BUCKETS if item_count <= b), SHIPPING_ITEM_BUCKETS[-1] + 1)
+    return (country.strip().lower(), state.strip().lower(), str(zip_code)[:3], bucket)
+
+
+def quote_for(user_id: str, street_address: str, city: str, state: str, country: str, zip_code: int) -> tuple[dict[str, int], dict[str, Any]]:
+    items, _ = load_cart(user_id)
+    key = shipping_quote_key(country, state, zip_code, sum(items.values()))
+
+    def load() -> dict[str, Any]:
+        client = ShippingClient(target=SHIPPING_SERVICE)
+        try:
+            return money_to_dict(client.get_quote(street_address, city, state, country, zip_code, items.items()).cost_usd)
+        finally:
+            client.close()
+
+    return items, shipping_quotes.get_or_load(key, load)
+
+@mcp.tool()
+@offload
+def quote_shipping(user_id: str, country: str, state: str, zip_code: int, street_address: str = "", city: str = "") -> dict[str, Any]:
+    """Estimate shipping and the order total for the user's current cart before checkout."""
+    items, shipping = quote_for(user_id, street_address, city, state, country, zip_code)
+    view = catalog.get()
+    subtotal = 0
+    for product_id, quantity in items.items():
+        row = view.row(product_id)
+        if row is not None:
+            subtotal += int(view.price_nanos[row]) * quantity
+    total = subtotal + shipping["units"] * NANOS + shipping["nanos"]
+    return {
+        "shipping_usd": shipping,
+        "subtotal_usd": {"currency_code": "USD", "units": subtotal // NANOS, "nanos": subtotal % NANOS},
+        "total_usd": {"currency_code": "USD", "units": total // NANOS, "nanos": total % NANOS},
+        "item_count": sum(items.values()),
+    }
+
+@mcp.tool()
+def prefetch_shipping_quote(user_id: str, country: str, state: str, zip_code: int, street_address: str = "", city: str = "") -> dict:
+    """Start fetching the shipping quote in the background as soon as the address is known; returns immediately."""
+    prefetch("shipping quote", quote_for, user_id, street_address, city, state, country, zip_code)
+    return {"status": "warming"}
+
+@mcp.tool()
+def set_currency_preference(user_id: str, currency_code: str) -> dict:
+    """Remember the user's preferred currency (ISO code such as "EUR"); place_order uses it when user_currency is empty."""
+    sessions.set_currency(user_id, currency_code.upper())
+    return {"status": "OK", "currency": currency_code.upper()}
+
+@mcp.tool()
+@offload
+def place_order(user_id: str, user_currency: str, street_address: str, city: str, state: str, country: str, zip_code: int, email: str, credit_card_number: str, credit_card_cvv: int, credit_card_expiration_year: int, credit_card_expiration_month: int, idempotency_key: str = "") -> dict:
+    """Place the order for the user's cart. Retrying with the same idempotency_key returns the first order instead of charging again."""
+    user_currency = user_currency or sessions.currency(user_id)
+
+    def call() -> dict:
+        client = CheckoutClient(target=CHECKOUT_SERVICE)
+        try:
+            resp = client.place_order(
+                user_id, user_currency, street_address, city, state, country, zip_code, email, credit_card_number, credit_card_cvv, credit_card_expiration_year, credit_card_expiration_month
+            )
+            result = {"order": order_result_to_dict(resp.order)}
+            logger.info(f"Place order response")
+            return result
+        finally:
+            # Checkout empties the cart on success; on failure its state is unknown
+            sessions.invalidate_cart(user_id)
+            client.close()
+
+    args = {
+        "user_id": user_id, "user_currency": user_currency, "street_address": street_address, "city": city, "state": state,
+        "country": country, "zip_code": zip_code, "email": email, "credit_card_number": credit_card_number,
+        "credit_card_expiration_year": credit_card_expiration_year, "credit_card_expiration_month": credit_card_expiration_month,
+    }
+    return idempotency.run("place_order", user_id, idempotency_key, args, call)
+
+
+warmed_up = threading.Event()
+
+
+def warmup() -> None:
+    """Connects the backend channels and loads the catalog snapshot and eco
+    scores, so the first tool calls on a new process take the fast path.
+
+    Unhealthy backends are only logged: they are handled per call by the
+    circuit breakers. The catalog is retried until it loads, and only then
+    is the server ready, since nearly every tool reads it.
+    """
+    started = time.monotonic()
+    targets = [(PRODUCT_CATALOG_SERVICE, "catalog"), (CART_SERVICE, "default"), (CHECKOUT_SERVICE, "default"), (SHIPPING_SERVICE, "default"), (AD_SERVICE, "default")]
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        for (target, _), healthy in zip(targets, executor.map(lambda t: health_check(pool.get(*t), timeout=WARMUP_TIMEOUT), targets)):
+            if not healthy:
+                logger.warning(f"Warmup: {target} is not serving")
+    while True:
+        try:
+            eco_scores.column(catalog.get())
+            break
+        except Exception as e:
+            logger.warning(f"Warmup: catalog not loaded, retrying in {WARMUP_RETRY_SECONDS}s: {e}")
+        if tool_limiter.draining:
+            return
+        time.sleep(WARMUP_RETRY_SECONDS)
+    warmed_up.set()
+    logger.info(f"Warmup finished in {time.monotonic() - started:.1f}s")
+
+
+def start_warmup() -> None:
+    if snapshots is not None:
+        # Mapping the snapshot is cheap; warmup then finds the catalog loaded
+        snapshots.restore()
+        snapshots.start()
+    threading.Thread(target=warmup, name="warmup", daemon=True).start()
+
+
+@mcp.custom_route("/healthz", methods=["GET"])
+async def healthz(request: Request) -> JSONResponse:
+    return JSONResponse({"status": "ok"})
+
+
+def log_stats() -> None:
+    logger.info(
+        f"Tool calls rejected: {tool_limiter.rejected}, sessions: {len(sessions)} (~{sessions.approx_bytes // 1024} KiB), "
+        f"ad contexts cached: {len(ads_cache)}, shipping quotes cached: {len(shipping_quotes)}"
+    )
+
+
+lifecycle.on_shutdown("stats", log_stats)
+lifecycle.on_shutdown("prefetcher", lambda: prefetcher.shutdown(wait=False, cancel_futures=True))
+if snapshots is not None:
+    lifecycle.on_shutdown("snapshots", snapshots.close)
+lifecycle.on_shutdown("idempotency", idempotency.close)
+lifecycle.on_shutdown("channels", pool.close_all)
+
+
+@mcp.custom_route("/readyz", methods=["GET"])
+async def readyz(request: Request) -> JSONResponse:
+    if tool_limiter.draining:
+        return JSONResponse({"status": "draining"}, status_code=503)
+    if warmed_up.is_set():
+        return JSONResponse({"status": "ready"})
+    return JSONResponse({"status": "warming up"}, status_code=503)
+
 
 # def build_parser() -> argparse.ArgumentParser:
 #     parser = argparse.ArgumentParser(description="Run gRPC client calls against Hipster Shop services")
@@ -158,10 +599,72 @@ def place_order(user_id: str, user_currency: str, street_address: str, city: str
 #     return parser
 
 
-def main():
-    mcp.run()  # Defaults to STDIO
-    # mcp.run(transport="streamable-http", host="127.0.0.1", port=8000, path="/mcp")
-    # mcp.run(transport="sse", host="127.0.0.1", port=8000)
+def build_server_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Green Next Shopping MCP server")
+    parser.add_argument("--transport", choices=["stdio", "http", "streamable-http", "sse"], default=MCP_TRANSPORT)
+    parser.add_argument("--host", default=MCP_HOST)
+    parser.add_argument("--port", type=int, default=MCP_PORT)
+    parser.add_argument("--path", default=MCP_PATH)
+    parser.add_argument("--workers", type=int, default=MCP_WORKERS, help="uvicorn worker processes (HTTP transports only)")
+    return parser
+
+
+def create_http_app():
+    # Factory for uvicorn workers: every worker process builds its own app.
+    # Across several workers a session's requests may land on any process, so
+    # streamable HTTP runs stateless there.
+    transport = "http" if MCP_TRANSPORT == "stdio" else MCP_TRANSPORT
+    start_warmup()
+    lifecycle.hold_streams_until_drained(tool_limiter, MCP_DRAIN_SECONDS)
+    app = mcp.http_app(
+        path=MCP_PATH,
+        transport=transport,
+        stateless_http=MCP_WORKERS > 1,
+        middleware=[StarletteMiddleware(HttpBackpressure, max_in_flight=MCP_MAX_INFLIGHT_REQUESTS)],
+    )
+    # On SIGTERM uvicorn stops accepting connections and waits up to
+    # MCP_DRAIN_SECONDS for open requests, whose streams stay open until the
+    # in-flight tool calls finish (see lifecycle.DrainingServer); the lifespan
+    # exit then releases any remaining streams and runs the shutdown hooks.
+    serve = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app):
+        async with serve(app) as state:
+            yield state
+        await anyio.to_thread.run_sync(lifecycle.drain, tool_limiter, MCP_DRAIN_SECONDS)
+        lifecycle.release_streams()
+        await anyio.to_thread.run_sync(lifecycle.shutdown)
+
+    app.router.lifespan_context = lifespan
+    return app
+
+
+def main(argv: list[str] | None = None):
+    args = build_server_parser().parse_args(argv)
+    if args.transport == "stdio":
+        start_warmup()
+        lifecycle.install_sigterm_handler(tool_limiter, MCP_DRAIN_SECONDS)
+        try:
+            mcp.run()  # Defaults to STDIO
+        finally:
+            # Also reached when the client closes stdin
+            lifecycle.shutdown()
+        return
+    if args.transport == "sse" and args.workers > 1:
+        raise SystemExit("SSE sessions are bound to one process; use --transport http with --workers > 1")
+
+    # Worker processes re-import this module, so the settings travel via env
+    os.environ.update(MCP_TRANSPORT=args.transport, MCP_PATH=args.path, MCP_WORKERS=str(args.workers))
+    app_dir = str(Path(__file__).parent)
+    options = dict(host=args.host, port=args.port, timeout_graceful_shutdown=int(MCP_DRAIN_SECONDS))
+    if args.workers > 1:
+        # Stateless HTTP holds no long-lived streams; workers drain in their lifespan
+        uvicorn.run("mcp_server:create_http_app", factory=True, workers=args.workers, app_dir=app_dir, **options)
+        return
+    if app_dir not in sys.path:
+        sys.path.insert(0, app_dir)
+    lifecycle.DrainingServer(uvicorn.Config("mcp_server:create_http_app", factory=True, **options)).run()
 
 
 if __name__ == "__main__":
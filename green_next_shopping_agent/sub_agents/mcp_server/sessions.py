@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence
+
+# Rough per-session footprint used for the memory cap: the slotted object and
+# its dict entry, plus each remembered product id (a tuple slot and the string)
+# and cart line.
+_SESSION_BYTES = 240
+_RESULT_SLOT_BYTES = 8
+_CART_LINE_BYTES = 120
+
+
+class UserSession:
+    __slots__ = ("cart", "cart_at", "last_results", "currency", "last_seen")
+
+    def __init__(self, now: float) -> None:
+        self.cart: Optional[Dict[str, int]] = None
+        self.cart_at = 0.0
+        # Product ids decoded from the catalog's string pools for this session
+        self.last_results: tuple = ()
+        self.currency = ""
+        self.last_seen = now
+
+    def approx_bytes(self) -> int:
+        results = sum(_RESULT_SLOT_BYTES + sys.getsizeof(product_id) for product_id in self.last_results)
+        return _SESSION_BYTES + results + _CART_LINE_BYTES * len(self.cart or ())
+
+
+class SessionStore:
+    """Lightweight per-user state kept between tool calls.
+
+    Holds the cart cache (filled read-through from GetCart, updated
+    write-through after AddItem/EmptyCart, dropped when an order is placed),
+    the product ids of the user's last search and their currency preference.
+    Sessions are evicted least-recently-used once max_sessions or max_bytes
+    is exceeded, and when idle for idle_seconds.
+    """
+
+    def __init__(self, max_sessions: int = 50000, max_bytes: int = 64 * 1024 * 1024, idle_seconds: float = 86400.0, cart_ttl_seconds: float = 600.0) -> None:
+        self._max_sessions = max_sessions
+        self._max_bytes = max_bytes
+        self._idle_seconds = idle_seconds
+        self._cart_ttl_seconds = cart_ttl_seconds
+        self._sessions: "OrderedDict[str, UserSession]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def approx_bytes(self) -> int:
+        return self._bytes
+
+    def _find(self, user_id: str, now: float) -> Optional[UserSession]:
+        session = self._sessions.get(user_id)
+        if session is None:
+            return None
+        if now - session.last_seen > self._idle_seconds:
+            self._drop(user_id)
+            return None
+        session.last_seen = now
+        self._sessions.move_to_end(user_id)
+        return session
+
+    def _session(self, user_id: str, now: float) -> UserSession:
+        session = self._find(user_id, now)
+        if session is None:
+            session = self._sessions[user_id] = UserSession(now)
+            self._bytes += session.approx_bytes()
+        return session
+
+    def _drop(self, user_id: str) -> None:
+        self._bytes -= self._sessions.pop(user_id).approx_bytes()
+
+    def _update(self, session: UserSession, before: int) -> None:
+        self._bytes += session.approx_bytes() - before
+        now = session.last_seen
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self._max_sessions and self._bytes <= self._max_bytes and now - oldest.last_seen <= self._idle_seconds:
+                break
+            self._drop(oldest_id)
+
+    def get_cart(self, user_id: str) -> Optional[Dict[str, int]]:
+        with self._lock:
+            now = time.monotonic()
+            session = self._find(user_id, now)
+            if session is None or session.cart is None or now - session.cart_at > self._cart_ttl_seconds:
+                return None
+            return dict(session.cart)
+
+    def put_cart(self, user_id: str, items: Dict[str, int]) -> None:
+        with self._lock:
+            now = time.monotonic()
+            session = self._session(user_id, now)
+            before = session.approx_bytes()
+            session.cart = dict(items)
+            session.cart_at = now
+            self._update(session, before)
+
+    def add_to_cart(self, user_id: str, product_id: str, quantity: int) -> None:
+        # Only carts we already know in full are updated; otherwise the next
+        # read goes to the backend.
+        with self._lock:
+            now = time.monotonic()
+            session = self._find(user_id, now)
+            if session is None or session.cart is None:
+                return
+            before = session.approx_bytes()
+            session.cart[product_id] = session.cart.get(product_id, 0) + quantity
+            session.cart_at = now
+            self._update(session, before)
+
+    def invalidate_cart(self, user_id: str) -> None:
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is not None and session.cart is not None:
+                before = session.approx_bytes()
+                session.cart = None
+                self._update(session, before)
+
+    def remember_results(self, user_id: str, product_ids: Sequence[str]) -> None:
+        with self._lock:
+            session = self._session(user_id, time.monotonic())
+            before = session.approx_bytes()
+            session.last_results = tuple(product_ids)
+            self._update(session, before)
+
+    def result_at(self, user_id: str, rank: int) -> Optional[str]:
+        """Product id at 1-based rank in the user's last search results."""
+        with self._lock:
+            session = self._find(user_id, time.monotonic())
+            if session is None or not 1 <= rank <= len(session.last_results):
+                return None
+            return session.last_results[rank - 1]
+
+    def set_currency(self, user_id: str, currency_code: str) -> None:
+        with self._lock:
+            session = self._session(user_id, time.monotonic())
+            session.currency = currency_code
+            self._update(session, session.approx_bytes())
+
+    def currency(self, user_id: str, default: str = "USD") -> str:
+        with self._lock:
+            session = self._find(user_id, time.monotonic())
+            return (session.currency if session is not None else "") or default
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from catalog_snapshot import CatalogSnapshot, CatalogView
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"GNSNAP01"
+ALIGN = 64
+CATALOG_FILE = "catalog.snap"
+
+
+def write_arrays(path: Path, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]) -> None:
+    """Writes arrays plus JSON metadata as one file, replaced atomically.
+
+    Layout: MAGIC, u64 header length, JSON header, then each array's raw
+    bytes at a 64-byte aligned offset so read_arrays can map them in place.
+    """
+    entries: Dict[str, list] = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        entries[name] = [array.dtype.str, list(array.shape), offset]
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+    header = json.dumps({"meta": meta, "arrays": entries}).encode()
+    start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(header)) + header)
+        for name, array in arrays.items():
+            f.seek(start + entries[name][2])
+            f.write(array.tobytes())
+        f.truncate(start + offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_arrays(path: Path) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Maps a write_arrays file; the arrays are read-only views of the page cache."""
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a snapshot file")
+    (header_len,) = struct.unpack_from("<Q", buffer, len(MAGIC))
+    header = json.loads(buffer[len(MAGIC) + 8:len(MAGIC) + 8 + header_len])
+    start = -(-(len(MAGIC) + 8 + header_len) // ALIGN) * ALIGN
+    arrays = {}
+    for name, (dtype, shape, offset) in header["arrays"].items():
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape, dtype=np.int64))
+        if count == 0:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        else:
+            arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=start + offset).reshape(shape)
+    return arrays, header["meta"]
+
+
+class SnapshotStore:
+    """Persists the catalog and TTL caches under directory for warm restarts.
+
+    The catalog is a mapped columnar file (see write_arrays); caches are JSON
+    with wall-clock expiry, so entries keep their remaining TTL across
+    restarts. save() runs periodically and at shutdown, restore() at startup.
+    """
+
+    def __init__(self, directory: Path, catalog: CatalogSnapshot, interval_seconds: float = 300.0) -> None:
+        self._directory = directory
+        self._catalog = catalog
+        self._interval_seconds = interval_seconds
+        self._caches: Dict[str, Tuple[TTLCache, Callable[[list], Hashable]]] = {}
+        self._saved_view: Optional[CatalogView] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def add_cache(self, name: str, cache: TTLCache, key_type: Callable[[list], Hashable] = tuple) -> None:
+        """Keys must be sequences (tuple, frozenset) of JSON values; key_type rebuilds them."""
+        self._caches[name] = (cache, key_type)
+
+    def restore(self) -> None:
+        path = self._directory / CATALOG_FILE
+        if path.exists():
+            try:
+                arrays, meta = read_arrays(path)
+                view = CatalogView.from_columns(arrays, meta)
+                age = max(0.0, time.time() - meta["saved_at"])
+                self._catalog.seed(view, age)
+                self._saved_view = view
+                logger.info(f"Restored {len(view)} products from {path} ({age:.0f}s old)")
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Could not restore catalog from {path}: {e}")
+        for name, (cache, key_type) in self._caches.items():
+            path = self._directory / f"{name}.json"
+            if not path.exists():
+                continue
+            try:
+                now = time.time()
+                restored = 0
+                for key, value, expires in json.loads(path.read_text()):
+                    if expires > now:
+                        cache.put(key_type(key), value, ttl_seconds=expires - now)
+                        restored += 1
+                logger.info(f"Restored {restored} {name} entries")
+            except (OSError, ValueError, TypeError) as e:
+                logger.warning(f"Could not restore {name} from {path}: {e}")
+
+    def save(self) -> None:
+        with self._lock:
+            self._directory.mkdir(parents=True, exist_ok=True)
+            current = self._catalog.peek()
+            if current is not None and current[0] is not self._saved_view:
+                view, age = current
+                arrays, meta = view.columns()
+                write_arrays(self._directory / CATALOG_FILE, arrays, {**meta, "saved_at": time.time() - age})
+                self._saved_view = view
+            now = time.time()
+            for name, (cache, _) in self._caches.items():
+                entries = [[list(key), value, now + left] for key, value, left in cache.items()]
+                path = self._directory / f"{name}.json"
+                tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+                tmp.write_text(json.dumps(entries))
+                os.replace(tmp, path)
+
+    def start(self) -> None:
+        def run() -> None:
+            while not self._stop.wait(self._interval_seconds):
+                try:
+                    self.save()
+                except Exception as e:
+                    logger.warning(f"Saving snapshots failed: {e}")
+
+        threading.Thread(target=run, name="snapshots", daemon=True).start()
+
+    def close(self) -> None:
+        self._stop.set()
+        self.save()
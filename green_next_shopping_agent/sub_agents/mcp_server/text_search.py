@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import logging
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from vector_index import PersistentIndex, VectorIndex
+
+logger = logging.getLogger(__name__)
+
+TEXT_EMBEDDING_MODEL = os.getenv("TEXT_EMBEDDING_MODEL", "text-embedding-004")
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbedder:
+    """Offline fallback: signed feature hashing of words and character trigrams.
+
+    Lexical only, but tolerant to inflections and typos ("bottles", "botle").
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 512) -> None:
+        self.dim = dim
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in _TOKEN.findall(text.lower()):
+                features = [word] + [f"#{word[i:i + 3]}" for i in range(max(len(word) - 2, 1))]
+                for feature in features:
+                    h = zlib.crc32(feature.encode())
+                    out[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return out
+
+
+class GeminiEmbedder:
+    """Semantic embeddings from the Gemini embedding API, batched."""
+
+    name = "gemini"
+    batch_size = 100
+
+    def __init__(self, model: str = TEXT_EMBEDDING_MODEL) -> None:
+        from google import genai
+
+        self._client = genai.Client()
+        self._model = model
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self._client.models.embed_content(model=self._model, contents=list(texts[start:start + self.batch_size]))
+            vectors.extend(e.values for e in response.embeddings)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+def default_embedder():
+    if os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY"):
+        try:
+            return GeminiEmbedder()
+        except Exception as e:
+            logger.warning(f"Gemini embeddings unavailable, using hashing embedder: {e}")
+    return HashingEmbedder()
+
+
+class SemanticSearch(PersistentIndex):
+    """Cosine search over product text embeddings stored as float16."""
+
+    def __init__(
+        self,
+        directory: Path,
+        documents: Callable[[], Iterable[Tuple[str, str]]],
+        embedder=None,
+        query_cache_size: int = 1024,
+        version: Optional[Callable[[], Optional[str]]] = None,
+    ) -> None:
+        self._embedder = embedder or default_embedder()
+        super().__init__(directory, f"product_text_{self._embedder.name}", version)
+        self._documents = documents
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_cache_size = query_cache_size
+        self._cache_lock = threading.Lock()
+
+    def build(self) -> VectorIndex:
+        ids, texts = [], []
+        for product_id, text in self._documents():
+            ids.append(product_id)
+            texts.append(text)
+        if not texts:
+            return VectorIndex([], np.zeros((0, 0), dtype=np.float16))
+        return VectorIndex.from_vectors(ids, self._embedder.embed(texts), dtype=np.float16)
+
+    def embed_queries(self, queries: Sequence[str]) -> np.ndarray:
+        """Embeds queries, reusing cached vectors for normalized repeats."""
+        keys = [" ".join(_TOKEN.findall(q.lower())) for q in queries]
+        found = {}
+        with self._cache_lock:
+            for key in set(keys):
+                vector = self._query_cache.get(key)
+                if vector is not None:
+                    self._query_cache.move_to_end(key)
+                    found[key] = vector
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing:
+            found.update(zip(missing, self._embedder.embed(missing)))
+            with self._cache_lock:
+                for key in missing:
+                    self._query_cache[key] = found[key]
+                while len(self._query_cache) > self._query_cache_size:
+                    self._query_cache.popitem(last=False)
+        return np.stack([found[key] for key in keys])
+
+    def search_many(self, queries: Sequence[str], k: int) -> List[List[Tuple[str, float]]]:
+        return self.get().top_k_batch(self.embed_queries(queries), k)
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        return self.search_many([query], k)[0]
+
+
+def product_document(name: str, description: str, categories: Iterable[str]) -> str:
+    return f"{name}. {description} Categories: {', '.join(categories)}"
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+from grpc_clients import SingleFlight
+
+T = TypeVar("T")
+
+
+class TTLCache(Generic[T]):
+    """LRU-bounded cache whose entries expire ttl_seconds after being stored.
+
+    get_or_load collapses concurrent misses for one key into a single load,
+    so a background prefetch and a tool call asking for the same key share
+    one backend RPC. Values are shared, so callers must not mutate them.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0) -> None:
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, T]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[T]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() > entry[0]:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, value: T, ttl_seconds: Optional[float] = None) -> None:
+        expires = time.monotonic() + (self._ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key: Hashable, load: Callable[[], T]) -> T:
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        def fill() -> T:
+            value = self.get(key)
+            if value is None:
+                value = load()
+                self.put(key, value)
+            return value
+
+        return self._flights.do(key, fill)
+
+    def items(self) -> List[Tuple[Hashable, T, float]]:
+        """Live (key, value, seconds left) entries, oldest first."""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value, expires - now) for key, (expires, value) in self._entries.items() if expires > now]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import abc
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SCORE_BLOCK_ROWS = 8192
+
+
+class VectorIndex:
+    """Row-normalized embedding matrix with the product id of every row.
+
+    Saved as <name>.npy + <name>.ids.json and memory-mapped on load, so the
+    matrix is shared with the page cache instead of copied into the heap.
+    """
+
+    def __init__(self, ids: Sequence[str], matrix: np.ndarray) -> None:
+        if len(ids) != matrix.shape[0]:
+            raise ValueError(f"{len(ids)} ids for {matrix.shape[0]} vectors")
+        self.ids = list(ids)
+        self.matrix = matrix
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_vectors(cls, ids: Sequence[str], vectors: np.ndarray, dtype: np.dtype = np.float32) -> "VectorIndex":
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return cls(ids, (vectors / norms).astype(dtype))
+
+    def save(self, directory: Path, name: str) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / f"{name}.npy", self.matrix)
+        (directory / f"{name}.ids.json").write_text(json.dumps(self.ids))
+
+    @classmethod
+    def load(cls, directory: Path, name: str) -> "VectorIndex":
+        matrix = np.load(directory / f"{name}.npy", mmap_mode="r")
+        ids = json.loads((directory / f"{name}.ids.json").read_text())
+        return cls(ids, matrix)
+
+    @staticmethod
+    def exists(directory: Path, name: str) -> bool:
+        return (directory / f"{name}.npy").exists() and (directory / f"{name}.ids.json").exists()
+
+    def top_k_batch(self, queries: np.ndarray, k: int) -> List[List[Tuple[str, float]]]:
+        """Cosine top-k for a (n_queries, dim) batch of query vectors."""
+        if len(self.ids) == 0:
+            return [[] for _ in range(len(queries))]
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = queries / norms
+        # Score in row blocks so a float16 matrix is upcast a block at a time
+        scores = np.empty((queries.shape[0], len(self.ids)), dtype=np.float32)
+        for start in range(0, len(self.ids), SCORE_BLOCK_ROWS):
+            block = self.matrix[start:start + SCORE_BLOCK_ROWS].astype(np.float32, copy=False)
+            scores[:, start:start + len(block)] = queries @ block.T
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in zip(scores, top):
+            ordered = candidates[np.argsort(-row[candidates])]
+            results.append([(self.ids[i], float(row[i])) for i in ordered])
+        return results
+
+    def top_k(self, query: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        return self.top_k_batch(query[np.newaxis, :], k)[0]
+
+
+class PersistentIndex(abc.ABC):
+    """Loads a saved VectorIndex on first use, building and saving it if absent.
+
+    Given a version callable (the catalog version), the index is saved with
+    the version it was built from and rebuilt once that version changes.
+    """
+
+    def __init__(self, directory: Path, name: str, version: Optional[Callable[[], Optional[str]]] = None) -> None:
+        self._directory = directory
+        self._name = name
+        self._version = version
+        self._index: Optional[VectorIndex] = None
+        self._index_version: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def build(self) -> VectorIndex:
+        """Embeds the current catalog."""
+
+    def get(self) -> VectorIndex:
+        version = self._version() if self._version else None
+        with self._lock:
+            if self._index is None or self._index_version != version:
+                if VectorIndex.exists(self._directory, self._name) and self._saved_version() == version:
+                    self._index = VectorIndex.load(self._directory, self._name)
+                else:
+                    if self._index is not None:
+                        logger.info(f"Catalog changed ({self._index_version} -> {version}), rebuilding {self._name} index")
+                    self._index = self._build_and_save(version)
+                self._index_version = version
+            return self._index
+
+    def rebuild(self) -> VectorIndex:
+        version = self._version() if self._version else None
+        with self._lock:
+            self._index = self._build_and_save(version)
+            self._index_version = version
+            return self._index
+
+    def _version_path(self) -> Path:
+        return self._directory / f"{self._name}.version"
+
+    def _saved_version(self) -> Optional[str]:
+        path = self._version_path()
+        return path.read_text().strip() if path.exists() else None
+
+    def _build_and_save(self, version: Optional[str]) -> VectorIndex:
+        logger.info(f"Building {self._name} index in {self._directory}")
+        index = self.build()
+        if len(index):
+            # Drop the old version first, so a crash mid-save forces a rebuild
+            self._version_path().unlink(missing_ok=True)
+            index.save(self._directory, self._name)
+            if version is not None:
+                self._version_path().write_text(version)
+            index = VectorIndex.load(self._directory, self._name)
+        return index
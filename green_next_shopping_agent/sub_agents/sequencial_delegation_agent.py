@@ -1,8 +1,21 @@
 from google.adk.agents import SequentialAgent
+from green_next_shopping_agent.answer_cache import cached_answer, store_answer
+from green_next_shopping_agent.product_cards import ProductCardStreamer
 from green_next_shopping_agent.sub_agents.analyse_the_product_greeness.agent import product_greeness_analyzer
 from green_next_shopping_agent.sub_agents.mcp_product_details_client_agent import mcp_product_details_agent
 
+# Product cards stream out as soon as a search returns, ahead of the details
+# agent's answer and the eco analysis.
+product_cards = ProductCardStreamer(
+    name="product_cards",
+    description="Shows product cards for search results while the details agent answers",
+    sub_agents=[mcp_product_details_agent],
+)
+
 sequencial_delegation_agent = SequentialAgent(
     name="sequencial_delegation_agent",
-    sub_agents=[mcp_product_details_agent,product_greeness_analyzer]
+    sub_agents=[product_cards,product_greeness_analyzer],
+    # Repeated queries on an unchanged catalog get the stored listing and eco analysis
+    before_agent_callback=cached_answer,
+    after_agent_callback=store_answer,
 )
\ No newline at end of file
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.tool_context import ToolContext
+
+from green_next_shopping_agent.constants import STATE_TOKEN_BUDGET, TOOL_OUTPUT_TOKEN_BUDGET
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARKER = " …[truncated]"
+
+# Same placeholder syntax ADK uses for state injection: {key}, {key?}, {app:key}
+_STATE_PLACEHOLDER = re.compile(r"\{((?:app:|user:|temp:)?[A-Za-z_]\w*)(\?)?\}")
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, default=str, ensure_ascii=False)
+
+
+class TokenLedger:
+    """Per agent, per turn (invocation) token counters."""
+
+    def __init__(self, max_turns: int = 256) -> None:
+        self._max_turns = max_turns
+        self._turns: "OrderedDict[str, Dict[str, Dict[str, int]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, invocation_id: str, agent_name: str, kind: str, tokens: int) -> None:
+        with self._lock:
+            turn = self._turns.get(invocation_id)
+            if turn is None:
+                turn = self._turns[invocation_id] = {}
+                while len(self._turns) > self._max_turns:
+                    self._turns.popitem(last=False)
+            counters = turn.setdefault(agent_name, {})
+            counters[kind] = counters.get(kind, 0) + tokens
+
+    def turn(self, invocation_id: str) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {agent: dict(c) for agent, c in self._turns.get(invocation_id, {}).items()}
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, int]]]:
+        with self._lock:
+            return {inv: {agent: dict(c) for agent, c in turn.items()} for inv, turn in self._turns.items()}
+
+
+ledger = TokenLedger()
+
+
+def trim_payload(value: Any, max_chars: int) -> Any:
+    """Shrink a JSON-like value until its serialized form fits in max_chars.
+
+    The largest members are trimmed first; lists keep their leading items and
+    report how many were dropped in a sibling "<key>_omitted" field.
+    """
+    text = _dumps(value)
+    if len(text) <= max_chars:
+        return value
+    if isinstance(value, str):
+        return value[: max(max_chars - len(TRUNCATION_MARKER), 0)] + TRUNCATION_MARKER
+    if isinstance(value, list):
+        kept, used = [], 2
+        for item in value:
+            size = len(_dumps(item)) + 2
+            if used + size > max_chars:
+                break
+            kept.append(item)
+            used += size
+        if not kept and value:
+            kept.append(trim_payload(value[0], max_chars))
+        return kept
+    if isinstance(value, dict):
+        out = dict(value)
+        over = len(text) - max_chars
+        sizes = sorted(((len(_dumps(v)), k) for k, v in value.items()), reverse=True)
+        for size, key in sizes:
+            if over <= 0:
+                break
+            trimmed = trim_payload(value[key], max(size - over, 64))
+            if isinstance(value[key], list) and len(trimmed) < len(value[key]):
+                out[f"{key}_omitted"] = len(value[key]) - len(trimmed)
+            over -= size - len(_dumps(trimmed))
+            out[key] = trimmed
+        return out
+    return value
+
+
+def budgeted_instruction(template: str, state_token_budget: int = STATE_TOKEN_BUDGET) -> Callable[[ReadonlyContext], str]:
+    """Instruction provider that injects session state like ADK does, but caps
+    every interpolated value at state_token_budget and records the tokens spent
+    on state interpolation for the current agent and turn."""
+    max_chars = state_token_budget * CHARS_PER_TOKEN
+
+    def provider(ctx: ReadonlyContext) -> str:
+        state = ctx.state
+        interpolated = 0
+
+        def replace(match: re.Match) -> str:
+            nonlocal interpolated
+            key, optional = match.group(1), match.group(2)
+            if key not in state:
+                if optional:
+                    return ""
+                raise KeyError(f"Context variable not found: `{key}`.")
+            value = str(state[key])
+            if len(value) > max_chars:
+                logger.info(f"Trimming state '{key}' for {ctx.agent_name}: {estimate_tokens(value)} -> {state_token_budget} tokens")
+                value = trim_payload(value, max_chars)
+            interpolated += estimate_tokens(value)
+            return value
+
+        instruction = _STATE_PLACEHOLDER.sub(replace, template)
+        ledger.add(ctx.invocation_id, ctx.agent_name, "state_tokens", interpolated)
+        return instruction
+
+    return provider
+
+
+def record_prompt_tokens(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    system_instruction = llm_request.config.system_instruction if llm_request.config else None
+    instruction_tokens = estimate_tokens(system_instruction) if isinstance(system_instruction, str) else 0
+    content_tokens = 0
+    for content in llm_request.contents:
+        for part in content.parts or []:
+            if part.text:
+                content_tokens += estimate_tokens(part.text)
+            elif part.function_response:
+                content_tokens += estimate_tokens(_dumps(part.function_response.response))
+            elif part.function_call:
+                content_tokens += estimate_tokens(_dumps(part.function_call.args))
+    ledger.add(callback_context.invocation_id, callback_context.agent_name, "instruction_tokens", instruction_tokens)
+    ledger.add(callback_context.invocation_id, callback_context.agent_name, "history_tokens", content_tokens)
+    ledger.add(callback_context.invocation_id, callback_context.agent_name, "llm_calls", 1)
+    return None
+
+
+def record_model_usage(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+    usage = llm_response.usage_metadata
+    if usage is None or llm_response.partial:
+        return None
+    agent_name = callback_context.agent_name
+    ledger.add(callback_context.invocation_id, agent_name, "prompt_tokens", usage.prompt_token_count or 0)
+    ledger.add(callback_context.invocation_id, agent_name, "output_tokens", usage.candidates_token_count or 0)
+    logger.info(f"Token usage [{callback_context.invocation_id}] {agent_name}: {ledger.turn(callback_context.invocation_id).get(agent_name)}")
+    return None
+
+
+def enforce_tool_budget(tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext, tool_response: Any) -> Optional[Dict]:
+    """Records tool-output tokens and trims results larger than the budget.
+
+    MCP results carry the same payload twice (text content and
+    structuredContent); only the structured copy is kept when trimming.
+    """
+    if hasattr(tool_response, "model_dump"):
+        response = tool_response.model_dump(mode="json", exclude_none=True)
+    elif isinstance(tool_response, dict):
+        response = tool_response
+    else:
+        return None
+
+    tokens = estimate_tokens(_dumps(response))
+    ledger.add(tool_context.invocation_id, tool_context.agent_name, "tool_output_tokens", tokens)
+    if tokens <= TOOL_OUTPUT_TOKEN_BUDGET:
+        return None
+
+    if response.get("structuredContent") is not None:
+        response = {k: v for k, v in response.items() if k != "content"}
+    trimmed = trim_payload(response, TOOL_OUTPUT_TOKEN_BUDGET * CHARS_PER_TOKEN)
+    logger.info(f"Trimmed {tool.name} output for {tool_context.agent_name}: {tokens} -> {estimate_tokens(_dumps(trimmed))} tokens")
+    return trimmed
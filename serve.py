@@ -0,0 +1,130 @@
+"""Runs the ADK web app with Kubernetes health endpoints and a warmup phase.
+
+/healthz answers as soon as the process serves HTTP (liveness). /readyz
+answers 200 only once every MCP toolset of the agent tree is connected,
+which starts the MCP servers and their catalog and channel warmup, and
+each of their servers has served a one-product catalog page.
+
+On SIGTERM uvicorn stops accepting connections and gives open requests up
+to GRACEFUL_SHUTDOWN_SECONDS; the toolsets are then closed, which lets the
+MCP servers drain their own tool calls and flush before exiting.
+
+    python serve.py
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Iterator
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from google.adk.agents.base_agent import BaseAgent
+from google.adk.cli.fast_api import get_fast_api_app
+from google.adk.tools.base_toolset import BaseToolset
+
+logger = logging.getLogger(__name__)
+
+HOST = os.getenv("ADK_WEB_HOST", "0.0.0.0")
+PORT = int(os.getenv("ADK_WEB_PORT", "8080"))
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+# Keep below the pod's terminationGracePeriodSeconds, leaving room for the MCP servers' drain
+GRACEFUL_SHUTDOWN_SECONDS = int(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", "15"))
+AGENTS_DIR = str(Path(__file__).resolve().parent)
+# Cheap tool call that needs the MCP server's catalog loaded
+CATALOG_PROBE = ("list_products_page", {"page_size": 1})
+
+readiness = {"ready": False, "detail": "warming up"}
+
+
+def toolsets(agent: BaseAgent) -> Iterator[BaseToolset]:
+    for tool in getattr(agent, "tools", []):
+        if isinstance(tool, BaseToolset):
+            yield tool
+    for sub_agent in agent.sub_agents:
+        yield from toolsets(sub_agent)
+
+
+async def probe_catalog(toolset: BaseToolset) -> None:
+    name, args = CATALOG_PROBE
+    for tool in await toolset.get_tools():
+        if tool.name == name:
+            result = await tool.run_async(args=args, tool_context=None)
+            if getattr(result, "isError", False):
+                detail = " ".join(getattr(item, "text", "") for item in result.content)
+                raise RuntimeError(f"MCP server catalog not ready: {detail}")
+            return
+
+
+async def warmup() -> None:
+    from green_next_shopping_agent.agent import root_agent
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    while True:
+        try:
+            for toolset in toolsets(root_agent):
+                await probe_catalog(toolset)
+            break
+        except Exception as e:
+            readiness["detail"] = f"warmup failed, retrying: {e}"
+            logger.warning(f"Warmup failed, retrying in {WARMUP_RETRY_SECONDS}s: {e}")
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+    readiness.update(ready=True, detail="ready")
+    logger.info(f"Warmup finished in {loop.time() - started:.1f}s")
+
+
+async def close_toolsets() -> None:
+    from green_next_shopping_agent.agent import root_agent
+    from green_next_shopping_agent.model_routing import route_stats
+    from green_next_shopping_agent.rate_limiter import limiter
+    from green_next_shopping_agent.token_budget import ledger
+
+    for toolset in toolsets(root_agent):
+        try:
+            await toolset.close()
+        except Exception as e:
+            logger.warning(f"Closing {type(toolset).__name__} failed: {e}")
+    turns = ledger.snapshot()
+    totals: dict = {}
+    for turn in turns.values():
+        for counters in turn.values():
+            for kind, tokens in counters.items():
+                totals[kind] = totals.get(kind, 0) + tokens
+    logger.info(f"Shut down after {len(turns)} tracked turns, tokens: {totals}")
+    logger.info(f"Model calls per agent (queueing in ms): {limiter.stats}")
+    logger.info(f"Model calls per route and model (latency, cost): {route_stats.snapshot()}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    task = asyncio.create_task(warmup())
+    try:
+        yield
+    finally:
+        task.cancel()
+        readiness.update(ready=False, detail="shutting down")
+        await close_toolsets()
+
+
+def create_app() -> FastAPI:
+    app = get_fast_api_app(agents_dir=AGENTS_DIR, web=True, host=HOST, port=PORT, lifespan=lifespan)
+
+    @app.get("/healthz")
+    async def healthz() -> dict:
+        return {"status": "ok"}
+
+    @app.get("/readyz")
+    async def readyz() -> JSONResponse:
+        return JSONResponse({"status": readiness["detail"]}, status_code=200 if readiness["ready"] else 503)
+
+    return app
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(create_app(), host=HOST, port=PORT, timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS)
@@ -13,5 +13,5 @@ python -c "import green_next_shopping_agent.agent; print('Agent imported success
 echo "ADK web help:"
 adk web --help || echo "ADK web command not available"
 
-echo "Starting ADK web..."
-exec adk web --host 0.0.0.0 --port 8080
+echo "Starting ADK web with warmup and health endpoints..."
+exec python serve.py